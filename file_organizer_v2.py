@@ -1,40 +1,163 @@
 import sys
 import os
 import shutil
-import hashlib
 from pathlib import Path
 import configparser
-import re
-from typing import Dict, Optional
+import multiprocessing
+import threading
+import time
+from typing import Dict, List, Optional, Set, Tuple
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
-                             QLabel, QListWidget, QPushButton, QTextEdit, QLineEdit, QCheckBox, 
-                             QComboBox, QFileDialog, QMessageBox, QProgressBar, QDialog, QSizePolicy)
-from PyQt6.QtCore import QThread
+                             QLabel, QListWidget, QPushButton, QPlainTextEdit, QLineEdit, QCheckBox, 
+                             QComboBox, QFileDialog, QMessageBox, QProgressBar, QDialog, QSizePolicy,
+                             QListView, QAbstractItemView)
+from PyQt6.QtCore import Qt, QThread, QTimer, pyqtSignal
 from PyQt6.QtGui import QFont
-from send2trash import send2trash
 import win32com.client
-# Configuração inicial
-def get_base_path():
-    if getattr(sys, 'frozen', False):
-        return Path(sys.executable).parent
-    return Path(__file__).parent
-
-CONFIG_PATH = get_base_path() / "config.ini"
-
-FILTERS = [
-    "*.*",
-    "*.jpg;*.jpeg;*.png;*.gif;*.bmp",  # Imagens
-    "*.mp4;*.avi;*.mkv;*.mov;*.wmv",  # Vídeos
-    "*.exe;*.msi;*.bat;*.cmd",  # Executáveis
-    "*.py;*.cs;*.java;*.js;*.cpp;*.html;*.css",  # Códigos
-    "*.doc;*.docx;*.pdf;*.txt;*.xlsx;*.pptx",  # Documentos
-    "*.zip;*.rar;*.7z;*.tar.gz",  # Arquivos Compactados
-    "*.mp3;*.wav;*.flac;*.aac",  # Áudio
-    r"\.jpe?g$",  # Regex: JPEG/JPG
-    r"\.mp[34]$",  # Regex: MP3/MP4
-    r"^doc.*\.pdf$",  # Regex: PDFs começando com "doc"
-    r"\.(cs|py|java)$"  # Regex: C#, Python, Java
-]
+from organizer_engine import (CONFIG_PATH, HASH_CACHE_PATH, JOURNAL_DIR, LOG_PATH, UNDO_DIR, FILTERS, DEFAULT_FILTER,
+                              CompactPlan, DirectoryTable, FileOrganizer, Options, PlanEntry, load_journal, read_config, write_config, undo_action,
+                              undo_run)
+from organizer_hashing import DEFAULT_HASH_ALGORITHM, HASH_ALGORITHMS, HashCache
+from organizer_journal import JOURNAL_SUFFIX, JournalState, pending_journals
+from organizer_log import LOG_VIEW_LINES, LogSink
+from organizer_preview import SORT_KEYS, PlanListModel
+from organizer_undo import UndoLog, latest_undo_log
+from organizer_watch import FolderWatch
+
+UI_REFRESH_MS = 33  # ~30 Hz: progresso e log são repassados à interface em lotes
+FILTER_DELAY_MS = 300  # O filtro da pré-visualização espera o usuário parar de digitar
+
+
+class BackgroundWorker(QThread):
+    # Log vai para o LogSink e o progresso fica aqui; a interface busca os dois a cada UI_REFRESH_MS
+    failed = pyqtSignal(str)
+
+    def __init__(self, log_sink: LogSink):
+        super().__init__()
+        self.log_sink = log_sink
+        self.current = 0
+        self.total = 0
+        self.error = None
+        self.cancelled = threading.Event()
+
+    def queue_log(self, message: str):
+        self.log_sink.write(message)
+
+    def set_progress(self, current: int, total: int):
+        self.current, self.total = current, total
+
+    def take_progress(self):
+        return self.current, self.total
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def run(self):
+        try:
+            self.work()
+        except Exception as e:
+            self.error = str(e)
+            self.failed.emit(self.error)
+
+    def work(self):
+        raise NotImplementedError
+
+
+class PreviewWorker(BackgroundWorker):
+    # Monta o plano em blocos; a interface busca os blocos prontos junto com o log
+    def __init__(self, log_sink: LogSink, options: Options, folders: DirectoryTable,
+                 hash_cache: Optional[HashCache]):
+        super().__init__(log_sink)
+        self.folders = folders
+        self.chunks: List[CompactPlan] = []
+        self.chunks_lock = threading.Lock()
+        self.organizer = FileOrganizer(options, log=self.queue_log, hash_cache=hash_cache)
+        self.cancelled = self.organizer.cancelled
+
+    def take_chunks(self) -> List[CompactPlan]:
+        with self.chunks_lock:
+            chunks, self.chunks = self.chunks, []
+        return chunks
+
+    def work(self):
+        count = 0
+        for chunk in self.organizer.plan_chunks(folders=self.folders, defer_hashes=True):
+            with self.chunks_lock:
+                self.chunks.append(chunk)
+            count += len(chunk)
+            self.set_progress(count, 0)  # Total desconhecido até o fim da varredura
+
+
+class ResolveWorker(BackgroundWorker):
+    # Compara por hash as colisões que a pré-visualização deixou pendentes. Roda em prioridade
+    # baixa enquanto o usuário revisa o plano; a interface aplica os resultados em lotes.
+    def __init__(self, log_sink: LogSink, organizer: FileOrganizer, pending: List[Tuple[int, PlanEntry]]):
+        super().__init__(log_sink)
+        self.organizer = organizer
+        self.pending = pending
+        self.results: List[Tuple[int, PlanEntry]] = []
+        self.results_lock = threading.Lock()
+        organizer.cancelled.clear()  # A pré-visualização pode ter sido interrompida
+        self.cancelled = organizer.cancelled
+
+    def take_results(self) -> List[Tuple[int, PlanEntry]]:
+        with self.results_lock:
+            results, self.results = self.results, []
+        return results
+
+    def work(self):
+        done = 0
+        self.set_progress(0, len(self.pending))
+        for resolved in self.organizer.resolve_pending(self.pending):
+            with self.results_lock:
+                self.results.extend(resolved)
+            done += len(resolved)
+            self.set_progress(done, len(self.pending))
+        self.pending = []  # O resolver fica vivo enquanto a interface não o solta
+
+
+class ProcessWorker(BackgroundWorker):
+    confirm_requested = pyqtSignal(str)
+
+    def __init__(self, log_sink: LogSink, options: Options, entries: CompactPlan, undo_stack: UndoLog,
+                 hash_cache: Optional[HashCache], resume: Optional[JournalState] = None):
+        super().__init__(log_sink)
+        self.entries = entries
+        self.resume = resume
+        self.confirm_result = False
+        self.organizer = FileOrganizer(options, log=self.queue_log, progress=self.set_progress,
+                                       confirm_delete=self.ask_confirm_delete, undo_stack=undo_stack,
+                                       hash_cache=hash_cache)
+        self.cancelled = self.organizer.cancelled
+
+    def ask_confirm_delete(self, file_to_delete: Path) -> bool:
+        # Bloqueia o worker até o usuário responder na thread principal
+        self.confirm_requested.emit(str(file_to_delete))
+        return self.confirm_result
+
+    def work(self):
+        self.organizer.execute(self.entries, self.resume)
+
+
+class WatchWorker(ProcessWorker):
+    # Modo observação: organiza os arquivos que chegam às origens até Cancelar
+    def work(self):
+        FolderWatch(self.organizer).run()
+
+
+class UndoWorker(BackgroundWorker):
+    # Desfaz a execução inteira fora da thread da interface, em paralelo
+    def __init__(self, log_sink: LogSink, undo_log: UndoLog, options: Options):
+        super().__init__(log_sink)
+        self.undo_log = undo_log
+        self.options = options
+        self.failures = 0
+
+    def work(self):
+        self.failures = undo_run(self.undo_log, self.options.threads_transferencia,
+                                 self.options.transferencias_por_disco, log=self.queue_log,
+                                 progress=self.set_progress, cancelled=self.cancelled)
+
 
 class FileOrganizerApp(QMainWindow):
     def __init__(self):
@@ -43,7 +166,28 @@ class FileOrganizerApp(QMainWindow):
         self.setGeometry(100, 100, 1280, 720)
         self.setFont(QFont("Consolas", 10))
         self.is_processing_selection = False
-        self.undo_stack = []
+        latest = latest_undo_log(UNDO_DIR)
+        try:  # Desfazer continua disponível depois de reabrir o programa
+            self.undo_stack = UndoLog(latest) if latest else []
+        except (OSError, ValueError):
+            self.undo_stack = []
+        self.preview_options = None
+        self.template_extras = {}  # Chaves do template sem widget (ex.: bufferhashkb), preservadas ao salvar
+        self.hash_cache = None
+        self.worker = None
+        self.resolver = None  # Verificação de duplicatas pendentes da pré-visualização
+        self.stopping_resolvers: Set[ResolveWorker] = set()  # Canceladas, terminando o arquivo atual
+        self.log_sink = LogSink(LOG_PATH)
+        self.ui_timer = QTimer(self)
+        self.ui_timer.setInterval(UI_REFRESH_MS)
+        self.ui_timer.timeout.connect(self.flush_worker_updates)
+        self.resolver_timer = QTimer(self)
+        self.resolver_timer.setInterval(UI_REFRESH_MS)
+        self.resolver_timer.timeout.connect(self.flush_resolver_updates)
+        self.filter_timer = QTimer(self)
+        self.filter_timer.setSingleShot(True)
+        self.filter_timer.setInterval(FILTER_DELAY_MS)
+        self.filter_timer.timeout.connect(lambda: self.preview_model.set_filter(self.entry_filtro_preview.text()))
         self.setup_ui()
         self.load_initial_config()
 
@@ -97,10 +241,17 @@ class FileOrganizerApp(QMainWindow):
         self.checkbox_lixeira = QCheckBox("Usar lixeira")
         self.checkbox_lixeira.setChecked(True)
         self.checkbox_subpastas = QCheckBox("Organizar em subpastas")
-        self.checkbox_hash = QCheckBox("Comparar hash (MD5)")
+        self.checkbox_hash = QCheckBox("Comparar hash")
+        self.combobox_algoritmo_hash = QComboBox()
+        self.combobox_algoritmo_hash.addItems(HASH_ALGORITHMS.keys())
+        self.combobox_algoritmo_hash.setCurrentText(DEFAULT_HASH_ALGORITHM)
         self.checkbox_abrir_destino = QCheckBox("Abrir pasta destino")
         self.checkbox_encerrar = QCheckBox("Encerrar após executar")
         self.checkbox_regex = QCheckBox("Usar Regex")
+        self.checkbox_cache_hash = QCheckBox("Reaproveitar hashes (cache)")
+        self.checkbox_cache_hash.setChecked(True)
+        self.checkbox_verificacao_rapida = QCheckBox("Verificação rápida (tamanho + data)")
+        self.checkbox_deduplicar = QCheckBox("Deduplicar por conteúdo (todas as origens)")
 
         checkbox_layout = QHBoxLayout()
         checkbox_layout.setContentsMargins(0, 0, 0, 0)
@@ -115,13 +266,14 @@ class FileOrganizerApp(QMainWindow):
         checkbox_layout3 = QHBoxLayout()
         checkbox_layout3.setContentsMargins(0, 0, 0, 0)
         checkbox_layout3.addWidget(self.checkbox_hash)
+        checkbox_layout3.addWidget(self.combobox_algoritmo_hash)
         checkbox_layout3.addWidget(self.checkbox_abrir_destino)
 
         self.label_filtro = QLabel("Filtro de arquivos:")
         self.combobox_filtro = QComboBox()
         self.combobox_filtro.addItems(FILTERS)
         self.combobox_filtro.setEditable(True)
-        self.combobox_filtro.setCurrentText("*.jpg;*.png")
+        self.combobox_filtro.setCurrentText(DEFAULT_FILTER)
         filter_layout = QHBoxLayout()
         filter_layout.setContentsMargins(0, 0, 0, 0)
         filter_layout.addWidget(self.label_filtro)
@@ -165,6 +317,9 @@ class FileOrganizerApp(QMainWindow):
         config_layout.addLayout(checkbox_layout3)
         config_layout.addWidget(self.checkbox_encerrar)
         config_layout.addWidget(self.checkbox_regex)
+        config_layout.addWidget(self.checkbox_cache_hash)
+        config_layout.addWidget(self.checkbox_verificacao_rapida)
+        config_layout.addWidget(self.checkbox_deduplicar)
         config_layout.addLayout(filter_layout)
         config_layout.addLayout(theme_layout)
         config_layout.addWidget(self.label_templates)
@@ -181,8 +336,9 @@ class FileOrganizerApp(QMainWindow):
         visualizacao_layout.setSpacing(8)
 
         self.label_log = QLabel("Log de Operações:")
-        self.logbox = QTextEdit()
+        self.logbox = QPlainTextEdit()
         self.logbox.setReadOnly(True)
+        self.logbox.setMaximumBlockCount(LOG_VIEW_LINES)  # Linhas mais antigas saem da tela (ficam no arquivo)
         self.logbox.setMinimumHeight(300)
         self.label_preview = QLabel("Pré-visualização:")
         preview_button_layout = QHBoxLayout()
@@ -191,25 +347,46 @@ class FileOrganizerApp(QMainWindow):
         self.button_preview = QPushButton("Pré-visualizar")
         self.button_executar = QPushButton("Executar")
         self.button_executar.setEnabled(False)
+        self.button_cancelar = QPushButton("Cancelar")
+        self.button_cancelar.setEnabled(False)
+        self.button_retomar = QPushButton("Retomar")
+        self.button_observar = QPushButton("Observar")
         self.button_restaurar_lixeira = QPushButton("Restaurar Lixeira")
         self.button_clear_log = QPushButton("Limpar Log")
         self.button_export_log = QPushButton("Exportar Log")
         self.button_undo = QPushButton("Desfazer")
         self.button_undo.setEnabled(False)
+        self.button_undo_tudo = QPushButton("Desfazer tudo")
+        self.button_undo_tudo.setEnabled(False)
         preview_button_layout.addWidget(self.button_preview)
         preview_button_layout.addWidget(self.button_executar)
+        preview_button_layout.addWidget(self.button_cancelar)
+        preview_button_layout.addWidget(self.button_retomar)
+        preview_button_layout.addWidget(self.button_observar)
         preview_button_layout.addWidget(self.button_restaurar_lixeira)
         preview_button_layout.addWidget(self.button_clear_log)
         preview_button_layout.addWidget(self.button_export_log)
         preview_button_layout.addWidget(self.button_undo)
+        preview_button_layout.addWidget(self.button_undo_tudo)
         preview_button_layout.addStretch()  # Stretch após o último botão (Desfazer)
-        self.listbox_preview = QListWidget()
-        self.listbox_preview.setSelectionMode(QListWidget.SelectionMode.MultiSelection)
+        self.preview_model = PlanListModel(self)
+        self.listbox_preview = QListView()
+        self.listbox_preview.setModel(self.preview_model)
+        self.listbox_preview.setUniformItemSizes(True)  # Altura fixa: a view não mede cada linha
+        self.listbox_preview.setSelectionMode(QAbstractItemView.SelectionMode.MultiSelection)
+        self.entry_filtro_preview = QLineEdit()
+        self.entry_filtro_preview.setPlaceholderText("Filtrar por caminho...")
+        self.combobox_ordem_preview = QComboBox()
+        self.combobox_ordem_preview.addItems(list(SORT_KEYS))
+        preview_filter_layout = QHBoxLayout()
+        preview_filter_layout.addWidget(self.entry_filtro_preview, stretch=1)
+        preview_filter_layout.addWidget(self.combobox_ordem_preview)
         self.button_remove_preview = QPushButton("Remover")
 
         visualizacao_layout.addWidget(self.label_log)
         visualizacao_layout.addWidget(self.logbox)
         visualizacao_layout.addLayout(preview_button_layout)
+        visualizacao_layout.addLayout(preview_filter_layout)
         visualizacao_layout.addWidget(self.listbox_preview)
         visualizacao_layout.addWidget(self.button_remove_preview)
         content_layout.addWidget(self.panel_visualizacao, stretch=1)
@@ -243,20 +420,30 @@ class FileOrganizerApp(QMainWindow):
         self.combobox_templates.currentTextChanged.connect(self.load_template)
         self.button_preview.clicked.connect(self.preview_files)
         self.button_executar.clicked.connect(self.execute)
+        self.button_cancelar.clicked.connect(self.cancel_execution)
+        self.button_retomar.clicked.connect(self.resume_execution)
+        self.button_observar.clicked.connect(self.watch_folders)
         self.button_restaurar_lixeira.clicked.connect(self.restore_recycle_bin)
         self.button_remove_preview.clicked.connect(self.remove_preview)
+        self.entry_filtro_preview.textChanged.connect(lambda text: self.filter_timer.start())
+        self.combobox_ordem_preview.currentTextChanged.connect(self.preview_model.set_sort)
         self.button_clear_log.clicked.connect(self.clear_log)
         self.button_export_log.clicked.connect(self.export_log)
         self.button_undo.clicked.connect(self.undo_action)
+        self.button_undo_tudo.clicked.connect(self.undo_all)
 
         # Ajustar tamanhos dos botões para consistência
         button_size = (100, 20)
         self.button_preview.setFixedSize(*button_size)
         self.button_executar.setFixedSize(*button_size)
+        self.button_cancelar.setFixedSize(*button_size)
+        self.button_retomar.setFixedSize(*button_size)
+        self.button_observar.setFixedSize(*button_size)
         self.button_restaurar_lixeira.setFixedSize(*button_size)
         self.button_clear_log.setFixedSize(*button_size)
         self.button_export_log.setFixedSize(*button_size)
         self.button_undo.setFixedSize(*button_size)
+        self.button_undo_tudo.setFixedSize(*button_size)
         self.button_remove_preview.setFixedSize(*button_size)
 
         # Forçar renderização antes de aplicar o tema
@@ -267,7 +454,7 @@ class FileOrganizerApp(QMainWindow):
 
     def apply_theme(self, theme: str):
         if not QApplication.instance().thread() == QThread.currentThread():
-            self.logbox.append("Erro: Tentativa de aplicar tema fora do thread principal.\n")
+            self.log("Erro: Tentativa de aplicar tema fora do thread principal.")
             return
         QApplication.instance().processEvents()
         config = self.load_config()
@@ -277,58 +464,36 @@ class FileOrganizerApp(QMainWindow):
             QWidget { background: #000000; color: #00FF00; border: none; }
             QPushButton { background: #333333; color: #00FF00; border: 1px solid #333333; }
             QPushButton:hover { background: #808080; }
-            QLineEdit, QTextEdit, QListWidget, QComboBox { background: #000000; color: #00FF00; border: 1px solid #333333; }
+            QLineEdit, QPlainTextEdit, QListWidget, QListView, QComboBox { background: #000000; color: #00FF00; border: 1px solid #333333; }
             QProgressBar { background: #333333; color: #00FF00; border: none; text-align: center; }
         """ if theme == "Neon" else """
             QWidget { background: #F0F0F0; color: #000000; border: none; }
             QPushButton { background: #E0E0E0; color: #000000; border: 1px solid #A0A0A0; }
             QPushButton:hover { background: #D0D0D0; }
-            QLineEdit, QTextEdit, QListWidget, QComboBox { background: #FFFFFF; color: #000000; border: 1px solid #A0A0A0; }
+            QLineEdit, QPlainTextEdit, QListWidget, QListView, QComboBox { background: #FFFFFF; color: #000000; border: 1px solid #A0A0A0; }
             QProgressBar { background: #E0E0E0; color: #000000; border: none; text-align: center; }
         """
         self.setStyleSheet(stylesheet)
     def load_config(self) -> Dict:
-        config = configparser.ConfigParser()
-        templates = {}
-        settings = {"theme": "Neon"}  # Neon como padrão inicial
-        if CONFIG_PATH.exists():
-            try:
-                config.read(CONFIG_PATH, encoding="utf-8-sig")
-                for section in config.sections():
-                    if section == "Settings":
-                        settings = dict(config[section])
-                        if "theme" not in settings or settings["theme"] not in ["Neon", "Claro"]:
-                            settings["theme"] = "Neon"  # Forçar Neon se inválido
-                    else:
-                        templates[section] = dict(config[section])
-            except configparser.MissingSectionHeaderError:
-                self.show_message("Erro: config.ini inválido. Criando novo arquivo.")
-                self.save_config(templates, settings)
-        else:
-            self.save_config(templates, settings)  # Criar config.ini com Neon
-        return {"Templates": templates, "Settings": settings}
+        try:
+            config = read_config(CONFIG_PATH)
+        except configparser.MissingSectionHeaderError:
+            self.show_message("Erro: config.ini inválido. Criando novo arquivo.")
+            config = {"Templates": {}, "Settings": {"theme": "Neon"}}
+            self.save_config(config["Templates"], config["Settings"])
+            return config
+        if not CONFIG_PATH.exists():
+            self.save_config(config["Templates"], config["Settings"])  # Criar config.ini com Neon
+        if config["Settings"].get("theme") not in ["Neon", "Claro"]:
+            config["Settings"]["theme"] = "Neon"  # Forçar Neon se inválido
+        return config
 
     def save_config(self, templates: Dict, settings: Dict):
-        config = configparser.ConfigParser()
-        config["Settings"] = settings
-        for name, data in templates.items():
-            config[name] = data
-        with CONFIG_PATH.open("w", encoding="utf-8") as f:
-            config.write(f)
+        write_config(templates, settings, CONFIG_PATH)
 
     def show_message(self, text: str, title: str = "Aviso"):
         QMessageBox.information(self, title, text)
 
-    def get_file_hash_md5(self, file_path: Path) -> Optional[str]:
-        try:
-            with file_path.open("rb") as f:
-                md5 = hashlib.md5()
-                for chunk in iter(lambda: f.read(4096), b""):
-                    md5.update(chunk)
-            return md5.hexdigest().lower()
-        except:
-            return None
-
     def load_initial_config(self):
         config = self.load_config()
         theme = config["Settings"].get("theme", "Neon")  # Neon como padrão
@@ -337,6 +502,9 @@ class FileOrganizerApp(QMainWindow):
         self.combobox_tema.setCurrentText(theme)
         self.apply_theme(theme)
         self.populate_templates_dropdown()
+        journals = pending_journals(JOURNAL_DIR)
+        if journals:
+            self.log(f"Execução interrompida encontrada: {journals[0]}. Use \"Retomar\" para continuar.")
 
     def populate_templates_dropdown(self):
         current = self.combobox_templates.currentText()
@@ -360,6 +528,7 @@ class FileOrganizerApp(QMainWindow):
                 return
             config = self.load_config()
             t = config["Templates"].get(sel, {})
+            self.template_extras = dict(t)
             self.listbox_origem.clear()
             if t.get("pastasorigem"):
                 for path in t["pastasorigem"].split(";"):
@@ -371,17 +540,21 @@ class FileOrganizerApp(QMainWindow):
             self.checkbox_lixeira.setChecked(t.get("usarlixeira", "True") == "True")
             self.checkbox_subpastas.setChecked(t.get("usarsubpastas", "False") == "True")
             self.checkbox_hash.setChecked(t.get("usarhash", "False") == "True")
+            self.combobox_algoritmo_hash.setCurrentText(t.get("algoritmohash", DEFAULT_HASH_ALGORITHM))
             self.checkbox_abrir_destino.setChecked(t.get("abrirdestino", "False") == "True")
             self.checkbox_encerrar.setChecked(t.get("encerrarprograma", "False") == "True")
-            self.combobox_filtro.setCurrentText(t.get("filtro", "*.jpg;*.png"))
+            self.combobox_filtro.setCurrentText(t.get("filtro", DEFAULT_FILTER))
             self.checkbox_regex.setChecked(t.get("usarregex", "False") == "True")
+            self.checkbox_cache_hash.setChecked(t.get("cachehash", "True") == "True")
+            self.checkbox_verificacao_rapida.setChecked(t.get("verificacaorapida", "False") == "True")
+            self.checkbox_deduplicar.setChecked(t.get("deduplicarconteudo", "False") == "True")
             self.textbox_template_name.setText(sel)
             # Remover redefinição do tema
             # current_theme = config["Settings"].get("theme", "Claro")
             # self.combobox_tema.setCurrentText(current_theme)
             # self.apply_theme(current_theme)
         except Exception as e:
-            self.logbox.append(f"Erro ao carregar template: {e}\n")
+            self.log(f"Erro ao carregar template: {e}")
         finally:
             self.is_processing_selection = False
 
@@ -441,7 +614,8 @@ class FileOrganizerApp(QMainWindow):
             self.show_message(f"Template '{template_name}' excluído com sucesso.")
 
     def get_current_settings(self) -> Dict:
-        return {
+        settings = dict(self.template_extras)
+        settings.update({
             "pastasorigem": ";".join(self.listbox_origem.item(i).text() for i in range(self.listbox_origem.count())),
             "pastadestino": self.textbox_destino.text(),
             "moverarquivos": str(self.checkbox_mover.isChecked()),
@@ -449,33 +623,60 @@ class FileOrganizerApp(QMainWindow):
             "usarlixeira": str(self.checkbox_lixeira.isChecked()),
             "usarsubpastas": str(self.checkbox_subpastas.isChecked()),
             "usarhash": str(self.checkbox_hash.isChecked()),
+            "algoritmohash": self.combobox_algoritmo_hash.currentText(),
             "abrirdestino": str(self.checkbox_abrir_destino.isChecked()),
             "encerrarprograma": str(self.checkbox_encerrar.isChecked()),
             "filtro": self.combobox_filtro.currentText(),
-            "usarregex": str(self.checkbox_regex.isChecked())
-        }
+            "usarregex": str(self.checkbox_regex.isChecked()),
+            "cachehash": str(self.checkbox_cache_hash.isChecked()),
+            "verificacaorapida": str(self.checkbox_verificacao_rapida.isChecked()),
+            "deduplicarconteudo": str(self.checkbox_deduplicar.isChecked())
+        })
+        return settings
+
+    def get_options(self) -> Options:
+        return Options.from_template(self.get_current_settings())
+
+    def confirm_delete(self, file_to_delete: Path) -> bool:
+        return QMessageBox.question(self, "Confirmar Exclusão",
+                                    f"Excluir permanentemente '{file_to_delete}'?",
+                                    QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No) == QMessageBox.StandardButton.Yes
+
+    def get_hash_cache(self, options: Options) -> Optional[HashCache]:
+        if not ((options.usar_hash or options.deduplicar_conteudo) and options.usar_cache_hash):
+            return None
+        if self.hash_cache is None:
+            self.hash_cache = HashCache(HASH_CACHE_PATH)
+        return self.hash_cache
+
+    def create_organizer(self, options: Options) -> FileOrganizer:
+        return FileOrganizer(options,
+                             log=self.log,
+                             confirm_delete=self.confirm_delete,
+                             undo_stack=self.undo_stack,
+                             hash_cache=self.get_hash_cache(options))
 
     def add_origem(self):
         folder = QFileDialog.getExistingDirectory(self, "Selecione uma pasta de origem")
         if folder and folder not in [self.listbox_origem.item(i).text() for i in range(self.listbox_origem.count())]:
             self.listbox_origem.addItem(folder)
-            self.logbox.append(f"Pasta adicionada: {folder}\n")
+            self.log(f"Pasta adicionada: {folder}")
 
     def remove_origem(self):
         selected = self.listbox_origem.currentItem()
         if selected:
-            self.logbox.append(f"Pasta removida: {selected.text()}\n")
+            self.log(f"Pasta removida: {selected.text()}")
             self.listbox_origem.takeItem(self.listbox_origem.row(selected))
 
     def select_destination(self):
         folder = QFileDialog.getExistingDirectory(self, "Selecione a pasta de destino")
         if folder:
             self.textbox_destino.setText(folder)
-            self.logbox.append(f"Destino selecionado: {folder}\n")
+            self.log(f"Destino selecionado: {folder}")
 
     def clear_destination(self):
         self.textbox_destino.clear()
-        self.logbox.append("Pasta de destino limpa\n")
+        self.log("Pasta de destino limpa")
 
     def clear_form(self):
         self.listbox_origem.clear()
@@ -485,25 +686,44 @@ class FileOrganizerApp(QMainWindow):
         self.checkbox_lixeira.setChecked(True)
         self.checkbox_subpastas.setChecked(False)
         self.checkbox_hash.setChecked(False)
+        self.combobox_algoritmo_hash.setCurrentText(DEFAULT_HASH_ALGORITHM)
         self.checkbox_abrir_destino.setChecked(False)
         self.checkbox_encerrar.setChecked(False)
-        self.combobox_filtro.setCurrentText("*.jpg;*.png")
+        self.combobox_filtro.setCurrentText(DEFAULT_FILTER)
         self.checkbox_regex.setChecked(False)
+        self.checkbox_cache_hash.setChecked(True)
+        self.checkbox_verificacao_rapida.setChecked(False)
+        self.checkbox_deduplicar.setChecked(False)
+        self.template_extras = {}
         self.textbox_template_name.clear()
-        self.listbox_preview.clear()
+        self.stop_resolver()
+        self.preview_model.clear()
         self.button_executar.setEnabled(False)
-        self.logbox.append("Formulário limpo\n")
+        self.log("Formulário limpo")
+
+    def log(self, message: str):
+        self.log_sink.write(message)
+        if self.worker is None:  # Com o worker rodando, o timer repassa em lotes
+            self.flush_log()
+
+    def flush_log(self):
+        lines = self.log_sink.take()
+        if lines:
+            self.logbox.appendPlainText("\n".join(lines))
 
     def clear_log(self):
         self.logbox.clear()
-        self.logbox.append("Log limpo\n")
+        self.log("Log limpo")
 
     def export_log(self):
-        file_name, _ = QFileDialog.getSaveFileName(self, "Salvar Log", f"log_{os.path.basename(__file__)[:-3]}_{os.time.strftime('%Y%m%d_%H%M%S')}.txt", "Text files (*.txt);;CSV files (*.csv)")
+        file_name, _ = QFileDialog.getSaveFileName(self, "Salvar Log", f"log_{os.path.basename(__file__)[:-3]}_{time.strftime('%Y%m%d_%H%M%S')}.txt", "Text files (*.txt);;CSV files (*.csv)")
         if file_name:
-            with open(file_name, "w", encoding="utf-8") as f:
-                f.write(self.logbox.toPlainText())
-            self.logbox.append(f"Log exportado para {file_name}\n")
+            try:
+                self.log_sink.export(Path(file_name))
+            except OSError as e:
+                self.show_message(f"Não foi possível exportar o log: {e}")
+                return
+            self.log(f"Log exportado para {file_name}")
 
     def restore_recycle_bin(self):
         dialog = QDialog(self)
@@ -542,13 +762,13 @@ class FileOrganizerApp(QMainWindow):
                         # Restaurar da lixeira local
                         dest = Path(self.textbox_destino.text()) / file_name
                         shutil.move(file_path, dest)
-                        self.logbox.append(f"Restaurado (lixeira local): {file_name} -> {dest}\n")
+                        self.log(f"Restaurado (lixeira local): {file_name} -> {dest}")
                     else:
                         # Restaurar da lixeira do sistema
                         for rb_item in recycle_bin.Items():
                             if rb_item.Name == file_name:
                                 rb_item.InvokeVerb("Restore")
-                                self.logbox.append(f"Restaurado (lixeira sistema): {file_name}\n")
+                                self.log(f"Restaurado (lixeira sistema): {file_name}")
                                 break
                 listbox_restore.takeItem(listbox_restore.row(item))
             if listbox_restore.count() == 0:
@@ -558,234 +778,270 @@ class FileOrganizerApp(QMainWindow):
         dialog.exec()
 
     def remove_preview(self):
-        selected = self.listbox_preview.selectedItems()
-        if selected:
-            for item in selected:
-                self.listbox_preview.takeItem(self.listbox_preview.row(item))
-            self.button_executar.setEnabled(self.listbox_preview.count() > 0)
-            self.logbox.append(f"Removidas {len(selected)} ações da pré-visualização.\n")
+        rows = [index.row() for index in self.listbox_preview.selectionModel().selectedRows()]
+        if rows:
+            self.listbox_preview.clearSelection()
+            removed = self.preview_model.exclude(rows)
+            self.button_executar.setEnabled(self.preview_model.action_count() > 0)
+            self.log(f"Removidas {removed} ações da pré-visualização.")
 
     def undo_action(self):
         if self.undo_stack:
             action = self.undo_stack.pop()
-            if action["action"] == "move":
-                shutil.move(action["dest"], action["source"])
-                self.logbox.append(f"Desfeito: Movido {action['dest']} -> {action['source']}\n")
-            elif action["action"] == "copy":
-                os.remove(action["dest"])
-                self.logbox.append(f"Desfeito: Removido {action['dest']}\n")
+            try:
+                self.log(undo_action(action))
+            except OSError as e:
+                self.undo_stack.append(action)  # Continua na pilha para tentar de novo
+                self.show_message(f"Não foi possível desfazer {action['dest']}: {e}")
             self.button_undo.setEnabled(len(self.undo_stack) > 0)
+            self.button_undo_tudo.setEnabled(len(self.undo_stack) > 0)
 
-    def preview_files(self):
-        self.listbox_preview.clear()
-        self.button_executar.setEnabled(False)
-        if self.listbox_origem.count() == 0:
-            self.show_message("Adicione pelo menos uma pasta de origem.")
+    def undo_all(self):
+        if not self.undo_stack:
             return
-        if not self.textbox_destino.text():
-            self.show_message("Selecione uma pasta de destino.")
+        answer = QMessageBox.question(self, "Desfazer tudo", f"Desfazer todas as {len(self.undo_stack)} ações da última execução?",
+                                      QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
+        if answer != QMessageBox.StandardButton.Yes:
             return
-        count = 0
-        filter_pattern = self.combobox_filtro.currentText()
-        use_regex = self.checkbox_regex.isChecked()
-        if use_regex:
-            try:
-                re.compile(filter_pattern)
-            except re.error:
-                self.show_message("Expressão regular inválida.")
-                return
+        self.logbox.clear()
+        options = self.preview_options or self.get_options()
+        self.worker = UndoWorker(self.log_sink, self.undo_stack, options)
+        self.worker.failed.connect(lambda error: self.show_message(f"Erro ao desfazer: {error}"))
+        self.worker.finished.connect(self.on_undo_finished)
+        self.set_running(True)
+        self.ui_timer.start()
+        self.worker.start()
+
+    def on_undo_finished(self):
+        self.ui_timer.stop()
+        self.flush_worker_updates()
+        complete = self.worker.error is None and self.worker.failures == 0 and not self.worker.cancelled.is_set()
+        self.worker = None
+        if complete:  # Tudo desfeito: o registro não serve mais
+            self.undo_stack.remove()
+            self.undo_stack = []
+        self.set_running(False)
+        self.progress_bar.setValue(0)
 
-        for i in range(self.listbox_origem.count()):
-            origem = Path(self.listbox_origem.item(i).text())
-            if not origem.exists():
-                self.listbox_preview.addItem(f"Erro: Pasta de origem não encontrada: {origem}")
-                continue
-            for file_path in origem.rglob("*"):
-                if not file_path.is_file():
-                    continue
-                if use_regex:
-                    if not re.search(filter_pattern, file_path.name):
-                        continue
-                else:
-                    patterns = [p.strip() for p in filter_pattern.split(";") if p.strip()]
-                    if not any(file_path.match(p) for p in patterns):
-                        continue
-                extension = file_path.suffix.lstrip('.').lower()
-                dest_folder = Path(self.textbox_destino.text()) / extension if self.checkbox_subpastas.isChecked() and extension else Path(self.textbox_destino.text())
-                dest_file = dest_folder / file_path.name
-                action = "Mover" if self.checkbox_mover.isChecked() else "Copiar"
-                if dest_file.exists():
-                    if self.checkbox_excluir_duplicatas.isChecked():
-                        is_duplicate = True
-                        if self.checkbox_hash.isChecked():
-                            src_hash = self.get_file_hash_md5(file_path)
-                            dest_hash = self.get_file_hash_md5(dest_file)
-                            is_duplicate = src_hash and dest_hash and src_hash == dest_hash
-                        if is_duplicate:
-                            if self.checkbox_mover.isChecked():
-                                destino = "Lixeira" if self.checkbox_lixeira.isChecked() else "Permanentemente"
-                                self.listbox_preview.addItem(f"Excluir duplicata: {file_path} -> {destino}")
-                            else:
-                                self.listbox_preview.addItem(f"Pular duplicata: {file_path}")
-                        else:
-                            dest_file = self.get_unique_filename(dest_file)
-                            self.listbox_preview.addItem(f"{action} (renomear): {file_path} -> {dest_file}")
-                    else:
-                        dest_file = self.get_unique_filename(dest_file)
-                        self.listbox_preview.addItem(f"{action} (renomear): {file_path} -> {dest_file}")
-                else:
-                    self.listbox_preview.addItem(f"{action}: {file_path} -> {dest_file}")
-                count += 1
+    def preview_files(self):
+        self.stop_resolver()
+        self.preview_model.clear()
+        self.button_executar.setEnabled(False)
+        options = self.get_options()
+        error = options.validate()
+        if error:
+            self.show_message(error)
+            return
+        self.preview_options = options
+        # O modelo guarda o plano: o que for removido aqui não é executado. As entradas
+        # aparecem conforme são decididas; Cancelar para a varredura e mantém o que já veio.
+        plan = self.preview_model.start_stream(options)
+        self.worker = PreviewWorker(self.log_sink, options, plan.folders, self.get_hash_cache(options))
+        self.worker.failed.connect(lambda error: self.show_message(f"Erro na pré-visualização: {error}"))
+        self.worker.finished.connect(self.on_preview_finished)
+        self.set_running(True)
+        self.ui_timer.start()
+        self.worker.start()
+
+    def on_preview_finished(self):
+        self.ui_timer.stop()
+        self.flush_worker_updates()
+        stopped = self.worker.cancelled.is_set()
+        organizer = self.worker.organizer
+        self.worker = None
+        self.set_running(False)
+        self.progress_bar.setMaximum(1)
+        self.progress_bar.setValue(0)
+        self.label_preview.setText("Pré-visualização:")
+        self.preview_model.finish_stream()
+        count = self.preview_model.action_count()
         if count > 0:
             self.button_executar.setEnabled(True)
-            self.logbox.append(f"Pré-visualização gerada: {count} ações\n")
+            self.log(f"Pré-visualização {'interrompida' if stopped else 'gerada'}: {count} ações")
         else:
-            self.logbox.append("Pré-visualização vazia: nenhum arquivo encontrado\n")
-
-    def get_unique_filename(self, dest_file: Path) -> Path:
-        base_name = dest_file.stem
-        extension = dest_file.suffix
-        counter = 1
-        new_file = dest_file
-        while new_file.exists():
-            new_file = dest_file.parent / f"{base_name}_{counter}{extension}"
-            counter += 1
-        return new_file
-
-    def move_or_copy_file(self, src: Path, dest: Path, move: bool):
-        if move:
-            shutil.move(src, dest)
-            self.undo_stack.append({"action": "move", "source": str(src), "dest": str(dest)})
-            self.logbox.append(f"Movido: {src} -> {dest}\n")
-        else:
-            shutil.copy2(src, dest)
-            self.undo_stack.append({"action": "copy", "source": str(src), "dest": str(dest)})
-            self.logbox.append(f"Copiado: {src} -> {dest}\n")
-        self.button_undo.setEnabled(True)
+            self.log("Pré-visualização vazia: nenhum arquivo encontrado")
+        plan = self.preview_model.entries
+        pending = [(position, plan[position]) for position in plan.pending_positions()]
+        if pending:
+            self.log(f"{len(pending)} possíveis duplicatas aguardando verificação por hash")
+            self.resolver = ResolveWorker(self.log_sink, organizer, pending)
+            self.resolver.failed.connect(lambda error: self.log(f"Erro na verificação de duplicatas: {error}"))
+            self.resolver.finished.connect(self.on_resolver_finished)
+            self.resolver_timer.start()
+            self.resolver.start(QThread.Priority.LowestPriority)
+
+    def flush_resolver_updates(self):
+        if self.resolver is None:
+            return
+        self.preview_model.apply_resolved(self.resolver.take_results())
+        current, total = self.resolver.take_progress()
+        self.label_preview.setText(f"Pré-visualização: verificando duplicatas ({current} de {total})...")
+
+    def on_resolver_finished(self):
+        self.resolver_timer.stop()
+        self.flush_resolver_updates()
+        current, total = self.resolver.take_progress()
+        self.resolver = None
+        self.label_preview.setText("Pré-visualização:")
+        self.log(f"Verificação de duplicatas concluída: {current} de {total} resolvidas")
+
+    def stop_resolver(self):
+        # Para a verificação e aplica o que já foi resolvido; o que sobrar é decidido na execução.
+        # Não espera a thread: ela termina o arquivo que está lendo e sai sozinha.
+        if self.resolver is None:
+            return
+        resolver, self.resolver = self.resolver, None
+        resolver.finished.disconnect(self.on_resolver_finished)
+        resolver.cancel()
+        self.resolver_timer.stop()
+        self.preview_model.apply_resolved(resolver.take_results())
+        self.label_preview.setText("Pré-visualização:")
+        # Referência mantida até o fim da thread (QThread destruído rodando derruba o programa)
+        resolver.finished.connect(lambda: self.stopping_resolvers.discard(resolver))
+        if resolver.isRunning():
+            self.stopping_resolvers.add(resolver)
 
     def process_files(self):
+        self.stop_resolver()  # Os hashes já calculados seguem no plano para a execução
+        self.start_worker(self.preview_model.included_entries())
+
+    def resume_execution(self):
+        journals = pending_journals(JOURNAL_DIR)
+        file_name, _ = QFileDialog.getOpenFileName(self, "Retomar execução", str(journals[0] if journals else JOURNAL_DIR),
+                                                   f"Diários de execução (*{JOURNAL_SUFFIX})")
+        if not file_name:
+            return
+        try:
+            options, entries, resume = load_journal(Path(file_name))
+        except (OSError, ValueError, KeyError) as e:
+            self.show_message(f"Diário inválido: {e}")
+            return
+        self.preview_options = options
+        self.stop_resolver()
+        self.preview_model.clear()
+        self.start_worker(entries, resume)
+
+    def watch_folders(self):
+        options = self.get_options()
+        error = options.validate()
+        if error:
+            self.show_message(error)
+            return
+        try:
+            options.pasta_destino.mkdir(parents=True, exist_ok=True)
+        except OSError as e:
+            self.show_message(f"Não foi possível criar a pasta destino: {e}")
+            return
+        self.stop_resolver()
+        self.preview_model.clear()
+        self.preview_options = options
+        self.start_worker(CompactPlan(), worker_class=WatchWorker)
+
+    def start_worker(self, entries: CompactPlan, resume: Optional[JournalState] = None,
+                     worker_class: type = ProcessWorker):
         self.logbox.clear()
-        pastas_origem = [Path(self.listbox_origem.item(i).text()) for i in range(self.listbox_origem.count())]
-        pasta_destino = Path(self.textbox_destino.text())
-        filter_pattern = self.combobox_filtro.currentText()
-        mover_arquivos = self.checkbox_mover.isChecked()
-        excluir_duplicatas = self.checkbox_excluir_duplicatas.isChecked()
-        usar_lixeira = self.checkbox_lixeira.isChecked()
-        usar_subpastas = self.checkbox_subpastas.isChecked()
-        usar_hash = self.checkbox_hash.isChecked()
-        usar_regex = self.checkbox_regex.isChecked()
-
-        # Contar arquivos pra barra de progresso
-        total_files = 0
-        for origem in pastas_origem:
-            for file_path in origem.rglob("*"):
-                if file_path.is_file():
-                    if usar_regex:
-                        if re.search(filter_pattern, file_path.name):
-                            total_files += 1
-                    else:
-                        patterns = [p.strip() for p in filter_pattern.split(";") if p.strip()]
-                        if any(file_path.match(p) for p in patterns):
-                            total_files += 1
-        self.progress_bar.setMaximum(total_files)
-        current_file = 0
-
-        for origem in pastas_origem:
-            if not origem.exists():
-                self.logbox.append(f"Pasta de origem não encontrada: {origem}\n")
-                continue
-            for file_path in origem.rglob("*"):
-                if not file_path.is_file():
-                    continue
-                if usar_regex:
-                    if not re.search(filter_pattern, file_path.name):
-                        continue
-                else:
-                    patterns = [p.strip() for p in filter_pattern.split(";") if p.strip()]
-                    if not any(file_path.match(p) for p in patterns):
-                        continue
-                current_file += 1
-                self.progress_bar.setValue(current_file)
-                extension = file_path.suffix.lstrip('.').lower()
-                dest_folder = pasta_destino / extension if usar_subpastas and extension else pasta_destino
-                dest_folder.mkdir(parents=True, exist_ok=True)
-                dest_file = dest_folder / file_path.name
-                if dest_file.exists():
-                    if excluir_duplicatas:
-                        is_duplicate = True
-                        if usar_hash:
-                            src_hash = self.get_file_hash_md5(file_path)
-                            dest_hash = self.get_file_hash_md5(dest_file)
-                            is_duplicate = src_hash and dest_hash and src_hash == dest_hash
-                        if is_duplicate:
-                            if mover_arquivos:
-                                src_mtime = os.path.getmtime(file_path)
-                                dest_mtime = os.path.getmtime(dest_file)
-                                if src_mtime < dest_mtime:
-                                    file_to_delete = file_path
-                                    action = "source"
-                                else:
-                                    file_to_delete = dest_file
-                                    action = "dest"
-                                if usar_lixeira:
-                                    try:
-                                        send2trash(str(file_to_delete))
-                                        self.logbox.append(f"Duplicata movida para lixeira: {file_to_delete}\n")
-                                    except:
-                                        lixeira_local = pasta_destino / "Lixeira"
-                                        lixeira_local.mkdir(exist_ok=True)
-                                        shutil.move(file_to_delete, lixeira_local / file_to_delete.name)
-                                        self.logbox.append(f"Duplicata movida para lixeira local: {file_to_delete}\n")
-                                else:
-                                    if QMessageBox.question(self, "Confirmar Exclusão",
-                                                           f"Excluir permanentemente '{file_to_delete}'?",
-                                                           QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No) == QMessageBox.StandardButton.Yes:
-                                        file_to_delete.unlink()
-                                        self.logbox.append(f"Duplicata excluída permanentemente: {file_to_delete}\n")
-                                if action == "source":
-                                    continue  # Pula a movimentação/cópia
-                                else:
-                                    self.move_or_copy_file(file_path, dest_file, mover_arquivos)
-                            else:
-                                self.logbox.append(f"Pulado duplicata: {file_path}\n")
-                                continue
-                        else:
-                            dest_file = self.get_unique_filename(dest_file)
-                            self.move_or_copy_file(file_path, dest_file, mover_arquivos)
-                    else:
-                        dest_file = self.get_unique_filename(dest_file)
-                        self.move_or_copy_file(file_path, dest_file, mover_arquivos)
-                else:
-                    self.move_or_copy_file(file_path, dest_file, mover_arquivos)
+        # Um registro de desfazer por execução; a retomada continua o da execução original
+        self.close_undo_log()
+        if resume is not None and resume.undo:
+            self.undo_stack = UndoLog.rewrite(Path(resume.undo))
+        else:
+            self.undo_stack = UndoLog.create(UNDO_DIR)
+        self.worker = worker_class(self.log_sink, self.preview_options, entries, self.undo_stack,
+                                   self.get_hash_cache(self.preview_options), resume)
+        self.worker.confirm_requested.connect(self.on_confirm_requested, Qt.ConnectionType.BlockingQueuedConnection)
+        self.worker.failed.connect(lambda error: self.show_message(f"Erro durante execução: {error}"))
+        self.worker.finished.connect(self.on_process_finished)
+        self.set_running(True)
+        self.ui_timer.start()
+        self.worker.start()
+
+    def on_confirm_requested(self, file_to_delete: str):
+        self.flush_worker_updates()
+        self.worker.confirm_result = self.confirm_delete(Path(file_to_delete))
+
+    def flush_worker_updates(self):
+        if self.worker is None:
+            return
+        self.flush_log()
+        if isinstance(self.worker, PreviewWorker):
+            for chunk in self.worker.take_chunks():
+                self.preview_model.append_chunk(chunk)
+            self.label_preview.setText(f"Pré-visualização: {len(self.preview_model.entries)} entradas...")
+        current, total = self.worker.take_progress()
+        self.progress_bar.setMaximum(total)
+        self.progress_bar.setValue(current)
+
+    def set_running(self, running: bool):
+        self.button_cancelar.setEnabled(running)
+        self.button_preview.setEnabled(not running)
+        self.button_retomar.setEnabled(not running)
+        self.button_observar.setEnabled(not running)
+        self.button_executar.setEnabled(False)
+        self.button_undo.setEnabled(not running and len(self.undo_stack) > 0)
+        self.button_undo_tudo.setEnabled(not running and len(self.undo_stack) > 0)
+
+    def cancel_execution(self):
+        if self.worker is not None:
+            self.button_cancelar.setEnabled(False)
+            self.worker.cancel()
+
+    def on_process_finished(self):
+        self.ui_timer.stop()
+        self.flush_worker_updates()
+        interrupted = self.worker.error is not None or self.worker.cancelled.is_set()
+        self.worker = None
+        self.set_running(False)
         self.progress_bar.setValue(0)
-        self.logbox.append("Processamento concluído.\n")
+        self.preview_model.clear()
+        if interrupted:
+            return
+        destino = self.preview_options.pasta_destino
+        if self.checkbox_abrir_destino.isChecked():
+            os.startfile(str(destino))
+        if self.checkbox_encerrar.isChecked():
+            QApplication.quit()
+
+    def closeEvent(self, event):
+        self.stop_resolver()
+        for resolver in list(self.stopping_resolvers):
+            resolver.wait()  # Antes de fechar o cache de hashes que elas usam
+        if self.worker is not None:
+            self.worker.cancel()
+            self.worker.wait()
+        if self.hash_cache is not None:
+            self.hash_cache.close()
+        self.close_undo_log()
+        self.log_sink.close()
+        super().closeEvent(event)
+
+    def close_undo_log(self):
+        if isinstance(self.undo_stack, UndoLog):
+            if len(self.undo_stack):
+                self.undo_stack.close()
+            else:
+                self.undo_stack.remove()
 
     def execute(self):
-        if self.listbox_origem.count() == 0:
-            self.show_message("Adicione pelo menos uma pasta de origem.")
+        if self.preview_options is None or self.preview_model.action_count() == 0:
+            self.show_message("Gere a pré-visualização antes de executar.")
             return
-        destino = Path(self.textbox_destino.text())
+        destino = self.preview_options.pasta_destino
         if not destino.exists():
             try:
                 destino.mkdir(parents=True)
-                self.logbox.append(f"Pasta destino criada: {destino}\n")
+                self.log(f"Pasta destino criada: {destino}")
             except Exception as e:
                 self.show_message(f"Não foi possível criar a pasta destino: {e}")
                 return
         self.button_executar.setEnabled(False)
         try:
             self.process_files()
-            if self.checkbox_abrir_destino.isChecked():
-                os.startfile(str(destino))
-            if self.checkbox_encerrar.isChecked():
-                QApplication.quit()
         except Exception as e:
             self.show_message(f"Erro durante execução: {e}")
-        finally:
-            self.button_executar.setEnabled(False)
-            self.listbox_preview.clear()
+            self.set_running(False)
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # Pool de processos de hash no executável do PyInstaller
     app = QApplication(sys.argv)
     window = FileOrganizerApp()
     window.show()
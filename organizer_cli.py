@@ -0,0 +1,229 @@
+import sys
+import argparse
+import threading
+import multiprocessing
+import configparser
+from pathlib import Path
+
+from organizer_engine import (CONFIG_PATH, HASH_CACHE_PATH, JOURNAL_DIR, UNDO_DIR, CompactPlan, FileOrganizer,
+                              Options, load_journal, load_plan, read_config, save_plan, undo_run)
+from organizer_hashing import HASH_ALGORITHMS, HashCache
+from organizer_transfer import DEFAULT_TRANSFER_WORKERS, DEFAULT_TRANSFERS_PER_DEVICE
+from organizer_undo import UndoLog
+from organizer_watch import WATCH_SETTLE_SECONDS, FolderWatch
+
+# Execução sem interface gráfica (cron, agendador de tarefas)
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Organizador de Arquivos (modo linha de comando)")
+    parser.add_argument("-t", "--template", help="Nome do template salvo no config.ini")
+    parser.add_argument("--config", type=Path, default=CONFIG_PATH, help="Caminho do config.ini")
+    parser.add_argument("--origem", action="append", type=Path, help="Pasta de origem (pode repetir)")
+    parser.add_argument("--destino", type=Path, help="Pasta de destino")
+    parser.add_argument("--filtro", help="Filtro de arquivos (ex.: \"*.jpg;*.png\")")
+    parser.add_argument("--mover", action=argparse.BooleanOptionalAction, default=None, help="Mover em vez de copiar")
+    parser.add_argument("--excluir-duplicatas", action=argparse.BooleanOptionalAction, default=None)
+    parser.add_argument("--lixeira", action=argparse.BooleanOptionalAction, default=None)
+    parser.add_argument("--subpastas", action=argparse.BooleanOptionalAction, default=None, help="Organizar em subpastas por extensão")
+    parser.add_argument("--hash", action=argparse.BooleanOptionalAction, default=None, help="Comparar hash das duplicatas")
+    parser.add_argument("--verificacao-rapida", action=argparse.BooleanOptionalAction, default=None,
+                        help="Mesmo tamanho e mesma data de modificação contam como duplicata, sem ler o conteúdo")
+    parser.add_argument("--algoritmo-hash", choices=sorted(HASH_ALGORITHMS), help="Algoritmo usado na comparação por hash")
+    parser.add_argument("--buffer-hash-kb", type=int, help="Tamanho do buffer de leitura do hash, em KiB")
+    parser.add_argument("--threads-hash", type=int, help="Quantos hashes calcular em paralelo")
+    parser.add_argument("--processos-hash", action=argparse.BooleanOptionalAction, default=None,
+                        help="Calcula os hashes em processos em vez de threads")
+    parser.add_argument("--cache-hash", action=argparse.BooleanOptionalAction, default=None,
+                        help=f"Reaproveita hashes salvos em {HASH_CACHE_PATH.name}")
+    parser.add_argument("--deduplicar", action=argparse.BooleanOptionalAction, default=None,
+                        help="Transfere uma só cópia de cada conteúdo, comparando todas as origens e o destino")
+    parser.add_argument("--threads-transferencia", type=int, help="Quantas cópias/movimentações executar ao mesmo tempo")
+    parser.add_argument("--transferencias-por-disco", type=int,
+                        help="Limite de transferências simultâneas em um mesmo disco (origem ou destino)")
+    parser.add_argument("--regex", action=argparse.BooleanOptionalAction, default=None, help="Filtro é expressão regular")
+    parser.add_argument("--preview", action="store_true", help="Apenas mostra as ações, sem executar")
+    parser.add_argument("--salvar-plano", type=Path, help="Salva o plano da pré-visualização em JSON")
+    parser.add_argument("--plano", type=Path, help="Executa um plano salvo com --salvar-plano (ignora as demais opções)")
+    parser.add_argument("--diario", action=argparse.BooleanOptionalAction, default=None,
+                        help=f"Grava um diário da execução em {JOURNAL_DIR.name}/ para retomar depois de uma queda")
+    parser.add_argument("--retomar", type=Path, help="Continua uma execução interrompida a partir do diário")
+    parser.add_argument("--desfazer", type=Path,
+                        help=f"Desfaz uma execução inteira a partir do registro salvo em {UNDO_DIR.name}/")
+    parser.add_argument("--observar", action="store_true",
+                        help="Fica observando as pastas de origem e organiza os arquivos que chegarem (Ctrl+C encerra)")
+    parser.add_argument("--espera", type=float, default=WATCH_SETTLE_SECONDS,
+                        help="Segundos sem alteração antes de organizar um arquivo no modo observação")
+    parser.add_argument("-y", "--yes", action="store_true", help="Confirma exclusões permanentes sem perguntar")
+    parser.add_argument("-q", "--quiet", action="store_true", help="Mostra apenas erros e o resumo")
+    return parser
+
+
+def options_from_args(args: argparse.Namespace, parser: argparse.ArgumentParser) -> Options:
+    template = {}
+    if args.template:
+        try:
+            templates = read_config(args.config)["Templates"]
+        except configparser.Error as e:
+            parser.error(f"config.ini inválido: {e}")
+        if args.template not in templates:
+            parser.error(f"Template '{args.template}' não encontrado em {args.config}")
+        template = templates[args.template]
+    options = Options.from_template(template)
+    if args.origem:
+        options.pastas_origem = args.origem
+    if args.destino:
+        options.pasta_destino = args.destino
+    if args.filtro is not None:
+        options.filtro = args.filtro
+    if args.algoritmo_hash:
+        options.algoritmo_hash = args.algoritmo_hash
+    if args.buffer_hash_kb is not None:
+        options.buffer_hash_kb = args.buffer_hash_kb
+    if args.threads_hash is not None:
+        options.threads_hash = args.threads_hash
+    if args.threads_transferencia is not None:
+        options.threads_transferencia = args.threads_transferencia
+    if args.transferencias_por_disco is not None:
+        options.transferencias_por_disco = args.transferencias_por_disco
+    for attr, value in (("mover_arquivos", args.mover), ("excluir_duplicatas", args.excluir_duplicatas),
+                        ("usar_lixeira", args.lixeira), ("usar_subpastas", args.subpastas),
+                        ("usar_hash", args.hash), ("usar_regex", args.regex),
+                        ("usar_cache_hash", args.cache_hash), ("verificacao_rapida", args.verificacao_rapida),
+                        ("processos_hash", args.processos_hash), ("deduplicar_conteudo", args.deduplicar),
+                        ("diario_execucao", args.diario)):
+        if value is not None:
+            setattr(options, attr, value)
+    error = options.validate()
+    if error:
+        parser.error(error)
+    return options
+
+
+print_lock = threading.Lock()
+
+
+def locked_print(message: str):
+    # Transferências em paralelo logam de várias threads; uma linha inteira por vez
+    with print_lock:
+        print(message)
+
+
+def main(argv=None) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    log = (lambda message: None) if args.quiet else locked_print
+    if args.desfazer:
+        return undo_from_log(args, parser, log)
+    entries = resume = None
+    if args.retomar:
+        try:
+            options, entries, resume = load_journal(args.retomar)
+        except (OSError, ValueError, KeyError) as e:
+            parser.error(f"Diário inválido: {e}")
+    elif args.plano:
+        try:
+            options, entries = load_plan(args.plano)
+        except (OSError, ValueError, KeyError) as e:
+            parser.error(f"Plano inválido: {e}")
+    else:
+        options = options_from_args(args, parser)
+    uses_hashes = options.usar_hash or options.deduplicar_conteudo
+    hash_cache = HashCache(HASH_CACHE_PATH) if uses_hashes and options.usar_cache_hash else None
+    try:
+        if args.observar and entries is None:
+            return watch_folders(args, options, log, hash_cache)
+        return run_organizer(args, options, entries, log, hash_cache, resume)
+    finally:
+        if hash_cache is not None:
+            hash_cache.close()
+
+
+def undo_from_log(args, parser, log) -> int:
+    try:
+        undo_log = UndoLog(args.desfazer)
+    except (OSError, ValueError) as e:
+        parser.error(f"Registro de desfazer inválido: {e}")
+    total = len(undo_log)
+    failures = undo_run(undo_log, args.threads_transferencia or DEFAULT_TRANSFER_WORKERS,
+                        args.transferencias_por_disco or DEFAULT_TRANSFERS_PER_DEVICE, log=log)
+    print(f"Ações desfeitas: {total - failures} de {total}")
+    if failures:
+        undo_log.close()  # Mantido para tentar de novo; o que já foi desfeito é reconhecido
+        return 1
+    undo_log.remove()
+    return 0
+
+
+def watch_folders(args, options, log, hash_cache) -> int:
+    if not options.pasta_destino.exists():
+        options.pasta_destino.mkdir(parents=True)
+        log(f"Pasta destino criada: {options.pasta_destino}")
+    undo_log = UndoLog.create(UNDO_DIR)
+    organizer = FileOrganizer(options, log=log, confirm_delete=lambda path: args.yes, undo_stack=undo_log,
+                              hash_cache=hash_cache)
+    try:
+        FolderWatch(organizer, args.espera).run()
+    except KeyboardInterrupt:
+        pass
+    except OSError as e:
+        print(f"Modo observação indisponível: {e}", file=sys.stderr)
+        return 1
+    finally:
+        print(f"Arquivos transferidos: {len(undo_log)}")
+        if len(undo_log):
+            undo_log.close()
+            print(f"Para desfazer: --desfazer {undo_log.path}")
+        else:
+            undo_log.remove()
+    return 0
+
+
+def run_organizer(args, options, entries, log, hash_cache, resume=None) -> int:
+    def create_organizer(undo_stack=None) -> FileOrganizer:
+        return FileOrganizer(options, log=log, confirm_delete=lambda path: args.yes, undo_stack=undo_stack,
+                             hash_cache=hash_cache)
+
+    if resume is None and (args.preview or args.salvar_plano):
+        organizer = create_organizer()
+        # Plano em fluxo: cada bloco é mostrado assim que decidido
+        chunks = organizer.plan_chunks() if entries is None else [entries]
+        plan = CompactPlan()
+        count = 0
+        for chunk in chunks:
+            if args.preview:
+                for entry in chunk:
+                    print(entry.describe(options))
+            count += sum(1 for i in range(len(chunk)) if chunk.has_dest(i))
+            if args.salvar_plano:
+                plan.extend(chunk)
+        if args.salvar_plano:
+            save_plan(args.salvar_plano, options, plan)
+            log(f"Plano salvo em {args.salvar_plano}")
+        if args.preview:
+            print(f"Pré-visualização gerada: {count} ações")
+        return 0
+    if not options.pasta_destino.exists():
+        options.pasta_destino.mkdir(parents=True)
+        log(f"Pasta destino criada: {options.pasta_destino}")
+    # Retomada continua o registro de desfazer da execução original
+    undo_log = UndoLog.rewrite(Path(resume.undo)) if resume is not None and resume.undo else UndoLog.create(UNDO_DIR)
+    organizer = create_organizer(undo_log)
+    try:
+        if resume is not None:
+            organizer.execute(entries, resume)
+        elif entries is not None:
+            organizer.execute(entries)
+        else:
+            organizer.run()
+    finally:
+        print(f"Arquivos transferidos: {len(undo_log)}")
+        if len(undo_log):
+            undo_log.close()
+            print(f"Para desfazer: --desfazer {undo_log.path}")
+        else:
+            undo_log.remove()
+    return 0
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,1413 @@
+import sys
+import os
+import errno
+import shutil
+import configparser
+import re
+import json
+import fnmatch
+import threading
+from array import array
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+from organizer_hashing import (DEFAULT_BUFFER_KB, DEFAULT_HASH_ALGORITHM, DEFAULT_HASH_WORKERS, HASH_ALGORITHMS,
+                               Comparison, DuplicateComparator, HashCache, HashPool)
+from organizer_journal import JournalState, RunJournal, read_journal
+from organizer_transfer import (DEFAULT_TRANSFER_WORKERS, DEFAULT_TRANSFERS_PER_DEVICE, DeviceLimiter, copy_file,
+                                partial_path, run_chains)
+from organizer_undo import UndoLog
+
+try:
+    from send2trash import send2trash
+except ImportError:  # Servidores sem send2trash usam a lixeira local
+    send2trash = None
+
+# Motor do organizador: sem dependência de Qt, usado pela GUI e pela CLI
+def get_base_path():
+    if getattr(sys, 'frozen', False):
+        return Path(sys.executable).parent
+    return Path(__file__).parent
+
+CONFIG_PATH = get_base_path() / "config.ini"
+HASH_CACHE_PATH = get_base_path() / "hash_cache.db"
+JOURNAL_DIR = get_base_path() / "diarios"
+UNDO_DIR = get_base_path() / "desfazer"
+LOG_PATH = get_base_path() / "organizador.log"
+
+FILTERS = [
+    "*.*",
+    "*.jpg;*.jpeg;*.png;*.gif;*.bmp",  # Imagens
+    "*.mp4;*.avi;*.mkv;*.mov;*.wmv",  # Vídeos
+    "*.exe;*.msi;*.bat;*.cmd",  # Executáveis
+    "*.py;*.cs;*.java;*.js;*.cpp;*.html;*.css",  # Códigos
+    "*.doc;*.docx;*.pdf;*.txt;*.xlsx;*.pptx",  # Documentos
+    "*.zip;*.rar;*.7z;*.tar.gz",  # Arquivos Compactados
+    "*.mp3;*.wav;*.flac;*.aac",  # Áudio
+    r"\.jpe?g$",  # Regex: JPEG/JPG
+    r"\.mp[34]$",  # Regex: MP3/MP4
+    r"^doc.*\.pdf$",  # Regex: PDFs começando com "doc"
+    r"\.(cs|py|java)$"  # Regex: C#, Python, Java
+]
+
+DEFAULT_FILTER = "*.jpg;*.png"
+
+# Ações do plano
+ACTION_COPY = "copy"
+ACTION_MOVE = "move"
+ACTION_SKIP = "skip"  # Duplicata mantida na origem
+ACTION_DELETE = "delete"  # Duplicata na origem é excluída
+ACTION_ERROR = "error"
+
+PLAN_VERSION = 1
+PLAN_CHUNK = 512  # Arquivos decididos por bloco na pré-visualização em fluxo
+
+
+def read_config(config_path: Path = CONFIG_PATH) -> Dict:
+    # Pode lançar configparser.MissingSectionHeaderError; quem chama decide o que fazer
+    config = configparser.ConfigParser()
+    templates = {}
+    settings = {"theme": "Neon"}
+    if config_path.exists():
+        config.read(config_path, encoding="utf-8-sig")
+        for section in config.sections():
+            if section == "Settings":
+                settings = dict(config[section])
+            else:
+                templates[section] = dict(config[section])
+    return {"Templates": templates, "Settings": settings}
+
+
+def write_config(templates: Dict, settings: Dict, config_path: Path = CONFIG_PATH):
+    config = configparser.ConfigParser()
+    config["Settings"] = settings
+    for name, data in templates.items():
+        config[name] = data
+    with config_path.open("w", encoding="utf-8") as f:
+        config.write(f)
+
+
+def parse_int(value: Optional[str], default: int) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+
+@dataclass
+class Options:
+    pastas_origem: List[Path]
+    pasta_destino: Path
+    filtro: str = DEFAULT_FILTER
+    mover_arquivos: bool = False
+    excluir_duplicatas: bool = True
+    usar_lixeira: bool = True
+    usar_subpastas: bool = False
+    usar_hash: bool = False
+    usar_regex: bool = False
+    usar_cache_hash: bool = True
+    verificacao_rapida: bool = False
+    algoritmo_hash: str = DEFAULT_HASH_ALGORITHM
+    buffer_hash_kb: int = DEFAULT_BUFFER_KB
+    threads_hash: int = DEFAULT_HASH_WORKERS
+    processos_hash: bool = False
+    deduplicar_conteudo: bool = False
+    threads_transferencia: int = DEFAULT_TRANSFER_WORKERS
+    transferencias_por_disco: int = DEFAULT_TRANSFERS_PER_DEVICE
+    diario_execucao: bool = True
+
+    @classmethod
+    def from_template(cls, t: Dict) -> "Options":
+        return cls(
+            pastas_origem=[Path(p.strip()) for p in t.get("pastasorigem", "").split(";") if p.strip()],
+            pasta_destino=Path(t.get("pastadestino", "")),
+            filtro=t.get("filtro", DEFAULT_FILTER),
+            mover_arquivos=t.get("moverarquivos", "False") == "True",
+            excluir_duplicatas=t.get("excluirduplicatas", "True") == "True",
+            usar_lixeira=t.get("usarlixeira", "True") == "True",
+            usar_subpastas=t.get("usarsubpastas", "False") == "True",
+            usar_hash=t.get("usarhash", "False") == "True",
+            usar_regex=t.get("usarregex", "False") == "True",
+            usar_cache_hash=t.get("cachehash", "True") == "True",
+            verificacao_rapida=t.get("verificacaorapida", "False") == "True",
+            algoritmo_hash=t.get("algoritmohash", DEFAULT_HASH_ALGORITHM),
+            buffer_hash_kb=parse_int(t.get("bufferhashkb"), DEFAULT_BUFFER_KB),
+            threads_hash=parse_int(t.get("threadshash"), DEFAULT_HASH_WORKERS),
+            processos_hash=t.get("processoshash", "False") == "True",
+            deduplicar_conteudo=t.get("deduplicarconteudo", "False") == "True",
+            threads_transferencia=parse_int(t.get("threadstransferencia"), DEFAULT_TRANSFER_WORKERS),
+            transferencias_por_disco=parse_int(t.get("transferenciaspordisco"), DEFAULT_TRANSFERS_PER_DEVICE),
+            diario_execucao=t.get("diarioexecucao", "True") == "True",
+        )
+
+    def to_template(self) -> Dict:
+        return {
+            "pastasorigem": ";".join(str(p) for p in self.pastas_origem),
+            "pastadestino": str(self.pasta_destino),
+            "moverarquivos": str(self.mover_arquivos),
+            "excluirduplicatas": str(self.excluir_duplicatas),
+            "usarlixeira": str(self.usar_lixeira),
+            "usarsubpastas": str(self.usar_subpastas),
+            "usarhash": str(self.usar_hash),
+            "filtro": self.filtro,
+            "usarregex": str(self.usar_regex),
+            "cachehash": str(self.usar_cache_hash),
+            "verificacaorapida": str(self.verificacao_rapida),
+            "algoritmohash": self.algoritmo_hash,
+            "bufferhashkb": str(self.buffer_hash_kb),
+            "threadshash": str(self.threads_hash),
+            "processoshash": str(self.processos_hash),
+            "deduplicarconteudo": str(self.deduplicar_conteudo),
+            "threadstransferencia": str(self.threads_transferencia),
+            "transferenciaspordisco": str(self.transferencias_por_disco),
+            "diarioexecucao": str(self.diario_execucao),
+        }
+
+    def validate(self) -> Optional[str]:
+        if not self.pastas_origem:
+            return "Adicione pelo menos uma pasta de origem."
+        if not str(self.pasta_destino) or str(self.pasta_destino) == ".":
+            return "Selecione uma pasta de destino."
+        if self.algoritmo_hash not in HASH_ALGORITHMS:
+            return f"Algoritmo de hash não suportado: {self.algoritmo_hash}"
+        if self.buffer_hash_kb <= 0:
+            return "O buffer de leitura do hash deve ser maior que zero."
+        if self.threads_hash <= 0:
+            return "O número de threads de hash deve ser maior que zero."
+        if self.threads_transferencia <= 0:
+            return "O número de transferências simultâneas deve ser maior que zero."
+        if self.transferencias_por_disco <= 0:
+            return "O limite de transferências por disco deve ser maior que zero."
+        if self.usar_regex:
+            try:
+                re.compile(self.filtro)
+            except re.error:
+                return "Expressão regular inválida."
+        return None
+
+
+@dataclass
+class PlanEntry:
+    action: str
+    source: Path
+    dest: Optional[Path] = None
+    renamed: bool = False
+    replace: bool = False  # Duplicata no destino é excluída antes de mover
+    message: str = ""
+    # (tamanho, mtime_ns) no momento da decisão; None = arquivo não existia
+    source_stat: Optional[Tuple[int, int]] = None
+    dest_stat: Optional[Tuple[int, int]] = None
+    src_hash: Optional[str] = None
+    dest_hash: Optional[str] = None
+    # Colisão de nome cuja comparação por hash ficou para depois (pré-visualização): a entrada
+    # ainda não é uma decisão e é decidida de novo se for executada assim
+    pending: bool = False
+
+    def to_dict(self) -> Dict:
+        return {
+            "action": self.action,
+            "source": str(self.source),
+            "dest": str(self.dest) if self.dest is not None else None,
+            "renamed": self.renamed,
+            "replace": self.replace,
+            "message": self.message,
+            "source_stat": self.source_stat,
+            "dest_stat": self.dest_stat,
+            "src_hash": self.src_hash,
+            "dest_hash": self.dest_hash,
+            "pending": self.pending,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "PlanEntry":
+        return cls(
+            action=data["action"],
+            source=Path(data["source"]),
+            dest=Path(data["dest"]) if data.get("dest") is not None else None,
+            renamed=data.get("renamed", False),
+            replace=data.get("replace", False),
+            message=data.get("message", ""),
+            source_stat=tuple(data["source_stat"]) if data.get("source_stat") else None,
+            dest_stat=tuple(data["dest_stat"]) if data.get("dest_stat") else None,
+            src_hash=data.get("src_hash"),
+            dest_hash=data.get("dest_hash"),
+            pending=data.get("pending", False),
+        )
+
+    def is_current(self) -> bool:
+        # Revalidação barata: um stat na origem e outro no destino, sem reler conteúdo
+        if self.pending:
+            return False
+        return stat_fingerprint(self.source) == self.source_stat and stat_fingerprint(self.dest) == self.dest_stat
+
+    def already_applied(self) -> bool:
+        # Efeito da entrada já visível no disco: a queda veio depois da transferência e antes
+        # do registro no diário (cópia e movimentação preservam tamanho e mtime)
+        if self.action in (ACTION_COPY, ACTION_MOVE):
+            if stat_fingerprint(self.dest) != self.source_stat:
+                return False
+            return self.action == ACTION_COPY or stat_fingerprint(self.source) is None
+        if self.action == ACTION_DELETE:
+            return stat_fingerprint(self.source) is None
+        return False
+
+    def describe(self, options: Options) -> str:
+        verb = "Mover" if self.action == ACTION_MOVE else "Copiar"
+        if self.action == ACTION_ERROR:
+            return f"Erro: {self.message}"
+        detail = f" ({self.message})" if self.message else ""
+        if self.pending:
+            return f"Possível duplicata (verificação pendente): {self.source} -> {self.dest}"
+        if self.action == ACTION_SKIP:
+            return f"Pular duplicata: {self.source}{detail}"
+        if self.action == ACTION_DELETE:
+            destino = "Lixeira" if options.usar_lixeira else "Permanentemente"
+            return f"Excluir duplicata: {self.source} -> {destino}{detail}"
+        if self.replace:
+            return f"{verb} (substituir duplicata): {self.source} -> {self.dest}"
+        if self.renamed:
+            return f"{verb} (renomear): {self.source} -> {self.dest}"
+        return f"{verb}: {self.source} -> {self.dest}"
+
+
+ACTION_CODES = {ACTION_COPY: 0, ACTION_MOVE: 1, ACTION_SKIP: 2, ACTION_DELETE: 3, ACTION_ERROR: 4}
+ACTION_NAMES = list(ACTION_CODES)
+FLAG_RENAMED = 1
+FLAG_REPLACE = 2
+FLAG_SOURCE_STAT = 4
+FLAG_PENDING = 8
+NO_FOLDER = -1
+
+
+class DirectoryTable:
+    # Cada pasta é guardada uma única vez; os arquivos guardam só o número dela
+    def __init__(self):
+        self.paths: List[Path] = []
+        self.ids: Dict[str, int] = {}
+
+    def intern(self, folder: Path) -> int:
+        key = str(folder)
+        folder_id = self.ids.get(key)
+        if folder_id is None:
+            folder_id = self.ids[key] = len(self.paths)
+            self.paths.append(folder)
+        return folder_id
+
+    def __getitem__(self, folder_id: int) -> Path:
+        return self.paths[folder_id]
+
+
+class CompactPlan:
+    # Plano em arrays paralelos, sem um objeto por arquivo: ação e flags em 1 byte cada, pastas
+    # como número da DirectoryTable, nomes concatenados num bytearray, tamanho e mtime da origem
+    # em arrays de 8 bytes. O que é raro (nome de destino diferente, stat do destino, mensagem,
+    # hashes) fica em dicionários esparsos. plan[i] monta o PlanEntry só quando alguém pede.
+    def __init__(self, folders: Optional[DirectoryTable] = None):
+        self.folders = folders if folders is not None else DirectoryTable()
+        self.actions = array("B")
+        self.flags = array("B")
+        self.source_folders = array("i")
+        self.dest_folders = array("i")
+        self.names = bytearray()
+        self.name_ends = array("Q")
+        self.sizes = array("q")
+        self.mtimes = array("q")
+        self.dest_names: Dict[int, str] = {}
+        self.dest_stats: Dict[int, Tuple[int, int]] = {}
+        self.messages: Dict[int, str] = {}
+        self.hashes: Dict[int, Tuple[Optional[str], Optional[str]]] = {}
+
+    @classmethod
+    def from_entries(cls, entries: Iterable[PlanEntry]) -> "CompactPlan":
+        plan = cls()
+        for entry in entries:
+            plan.append(entry)
+        return plan
+
+    def append(self, entry: PlanEntry):
+        self.actions.append(0)
+        self.flags.append(0)
+        self.source_folders.append(self.folders.intern(entry.source.parent))
+        self.dest_folders.append(NO_FOLDER)
+        self.names += entry.source.name.encode("utf-8", "surrogatepass")
+        self.name_ends.append(len(self.names))
+        self.sizes.append(0)
+        self.mtimes.append(0)
+        self[len(self.actions) - 1] = entry
+
+    def __setitem__(self, i: int, entry: PlanEntry):
+        # Troca a decisão de uma posição (ex.: colisão resolvida); a origem continua a mesma
+        self.actions[i] = ACTION_CODES[entry.action]
+        self.flags[i] = ((FLAG_RENAMED if entry.renamed else 0) | (FLAG_REPLACE if entry.replace else 0)
+                         | (FLAG_SOURCE_STAT if entry.source_stat is not None else 0)
+                         | (FLAG_PENDING if entry.pending else 0))
+        self.sizes[i], self.mtimes[i] = entry.source_stat or (0, 0)
+        for sparse in (self.dest_names, self.dest_stats, self.messages, self.hashes):
+            sparse.pop(i, None)
+        if entry.dest is None:
+            self.dest_folders[i] = NO_FOLDER
+        else:
+            self.dest_folders[i] = self.folders.intern(entry.dest.parent)
+            if entry.dest.name != entry.source.name:
+                self.dest_names[i] = entry.dest.name
+        if entry.dest_stat is not None:
+            self.dest_stats[i] = entry.dest_stat
+        if entry.message:
+            self.messages[i] = entry.message
+        if entry.src_hash is not None or entry.dest_hash is not None:
+            self.hashes[i] = (entry.src_hash, entry.dest_hash)
+
+    def copy_from(self, other: "CompactPlan", i: int):
+        # Cópia crua de uma posição de outro plano com a mesma DirectoryTable (sem montar o PlanEntry)
+        j = len(self.actions)
+        self.actions.append(other.actions[i])
+        self.flags.append(other.flags[i])
+        self.source_folders.append(other.source_folders[i])
+        self.dest_folders.append(other.dest_folders[i])
+        self.names += other.name_bytes(i)
+        self.name_ends.append(len(self.names))
+        self.sizes.append(other.sizes[i])
+        self.mtimes.append(other.mtimes[i])
+        for sparse, other_sparse in ((self.dest_names, other.dest_names), (self.dest_stats, other.dest_stats),
+                                     (self.messages, other.messages), (self.hashes, other.hashes)):
+            if i in other_sparse:
+                sparse[j] = other_sparse[i]
+
+    def extend(self, other: "CompactPlan"):
+        if other.folders is self.folders:
+            for i in range(len(other)):
+                self.copy_from(other, i)
+        else:
+            for entry in other:
+                self.append(entry)
+
+    def select(self, positions: Iterable[int]) -> "CompactPlan":
+        plan = CompactPlan(self.folders)
+        for i in positions:
+            plan.copy_from(self, i)
+        return plan
+
+    def name_bytes(self, i: int) -> bytes:
+        return bytes(self.names[self.name_ends[i - 1] if i else 0:self.name_ends[i]])
+
+    def name(self, i: int) -> str:
+        return self.name_bytes(i).decode("utf-8", "surrogatepass")
+
+    def action(self, i: int) -> str:
+        return ACTION_NAMES[self.actions[i]]
+
+    def is_pending(self, i: int) -> bool:
+        return bool(self.flags[i] & FLAG_PENDING)
+
+    def pending_positions(self) -> List[int]:
+        return [i for i, flags in enumerate(self.flags) if flags & FLAG_PENDING]
+
+    def has_dest(self, i: int) -> bool:
+        return self.dest_folders[i] != NO_FOLDER
+
+    def source_text(self, i: int) -> str:
+        return os.path.join(str(self.folders[self.source_folders[i]]), self.name(i))
+
+    def dest_text(self, i: int) -> str:
+        if not self.has_dest(i):
+            return ""
+        return os.path.join(str(self.folders[self.dest_folders[i]]), self.dest_names.get(i) or self.name(i))
+
+    def text_matcher(self, text: str) -> Callable[[int], bool]:
+        # Busca sem maiúsculas na origem ou no destino de uma posição. Sem separador no texto,
+        # ele cabe inteiro na pasta ou no nome: cada pasta é testada uma vez e cada linha só
+        # decodifica o nome, sem montar o caminho completo.
+        text = text.lower()
+        if os.sep in text or (os.altsep and os.altsep in text):
+            return lambda i: text in self.source_text(i).lower() or text in self.dest_text(i).lower()
+        folder_hits = [text in str(folder).lower() for folder in self.folders.paths]
+
+        def matches(i: int) -> bool:
+            dest_folder = self.dest_folders[i]
+            if folder_hits[self.source_folders[i]] or (dest_folder != NO_FOLDER and folder_hits[dest_folder]):
+                return True
+            if text in self.name(i).lower():
+                return True
+            dest_name = self.dest_names.get(i)
+            return dest_folder != NO_FOLDER and dest_name is not None and text in dest_name.lower()
+        return matches
+
+    def __len__(self) -> int:
+        return len(self.actions)
+
+    def __getitem__(self, i: int) -> PlanEntry:
+        name = self.name(i)
+        flags = self.flags[i]
+        dest = None
+        if self.dest_folders[i] != NO_FOLDER:
+            dest = self.folders[self.dest_folders[i]] / self.dest_names.get(i, name)
+        src_hash, dest_hash = self.hashes.get(i, (None, None))
+        return PlanEntry(ACTION_NAMES[self.actions[i]], self.folders[self.source_folders[i]] / name, dest,
+                         renamed=bool(flags & FLAG_RENAMED), replace=bool(flags & FLAG_REPLACE),
+                         message=self.messages.get(i, ""),
+                         source_stat=(self.sizes[i], self.mtimes[i]) if flags & FLAG_SOURCE_STAT else None,
+                         dest_stat=self.dest_stats.get(i), src_hash=src_hash, dest_hash=dest_hash,
+                         pending=bool(flags & FLAG_PENDING))
+
+    def __iter__(self) -> Iterator[PlanEntry]:
+        for i in range(len(self)):
+            yield self[i]
+
+
+class FileFilter:
+    # Compila uma especificação no formato de FILTERS uma única vez por execução.
+    # "*.ext" vira consulta num frozenset pela extensão; os demais globs viram uma
+    # única regex combinada. Como PurePath.match, globs só ignoram maiúsculas/minúsculas
+    # no Windows; no Linux "*.jpg" não seleciona "a.JPG".
+    def __init__(self, spec: str, use_regex: bool = False, ignore_case: bool = os.name == "nt"):
+        self.fold = str.lower if ignore_case else str
+        self.extensions = frozenset()
+        self.pattern = None
+        if use_regex:
+            self.pattern = re.compile(spec)
+            self.match_any = self.pattern.search
+            return
+        extensions = set()
+        globs = []
+        for p in (p.strip() for p in spec.split(";")):
+            if not p:
+                continue
+            ext = p[2:]
+            if p.startswith("*.") and ext and not any(c in ext for c in "*?[]./\\"):
+                extensions.add(self.fold(ext))
+            else:
+                globs.append(fnmatch.translate(p))
+        self.extensions = frozenset(extensions)
+        if globs:
+            self.pattern = re.compile("|".join(globs), re.IGNORECASE if ignore_case else 0)
+        self.match_any = self.pattern.match if self.pattern else None
+
+    def __call__(self, name: str) -> bool:
+        if self.extensions:
+            dot = name.rfind(".")
+            if dot >= 0 and self.fold(name[dot + 1:]) in self.extensions:
+                return True
+        return self.match_any is not None and self.match_any(name) is not None
+
+
+class FileRecord(NamedTuple):
+    # Dados de stat obtidos uma única vez durante a varredura
+    path: Path
+    size: int
+    mtime_ns: int
+    ino: int
+    dev: int
+
+    @property
+    def fingerprint(self) -> Tuple[int, int]:
+        return (self.size, self.mtime_ns)
+
+    @classmethod
+    def from_stat(cls, path: Path, st: os.stat_result) -> "FileRecord":
+        return cls(path, st.st_size, st.st_mtime_ns, st.st_ino, st.st_dev)
+
+
+def walk_files(root: Path, accept: Callable[[str], bool]) -> Iterator[FileRecord]:
+    # os.scandir com pilha explícita; o filtro olha só o nome, antes de qualquer stat
+    stack = [str(root)]
+    while stack:
+        folder = stack.pop()
+        try:
+            with os.scandir(folder) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.is_file() and accept(entry.name):
+                            yield FileRecord.from_stat(Path(entry.path), entry.stat())
+                    except OSError:
+                        continue
+        except OSError:  # Pasta sem permissão ou removida durante a varredura
+            continue
+
+
+def save_plan(plan_path: Path, options: Options, entries: Iterable[PlanEntry]):
+    data = {"version": PLAN_VERSION, "options": options.to_template(),
+            "entries": [entry.to_dict() for entry in entries]}
+    with plan_path.open("w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+
+
+def load_plan(plan_path: Path) -> Tuple[Options, CompactPlan]:
+    with plan_path.open("r", encoding="utf-8") as f:
+        data = json.load(f)
+    if data.get("version") != PLAN_VERSION:
+        raise ValueError(f"Versão de plano não suportada: {data.get('version')}")
+    return Options.from_template(data["options"]), CompactPlan.from_entries(map(PlanEntry.from_dict, data["entries"]))
+
+
+def load_journal(journal_path: Path) -> Tuple[Options, CompactPlan, JournalState]:
+    entries = CompactPlan()
+    state = read_journal(journal_path, lambda data: entries.append(PlanEntry.from_dict(data)))
+    return Options.from_template(state.options), entries, state
+
+
+def stat_fingerprint(file_path: Optional[Path]) -> Optional[Tuple[int, int]]:
+    if file_path is None:
+        return None
+    try:
+        st = os.stat(file_path)
+    except OSError:
+        return None
+    return (st.st_size, st.st_mtime_ns)
+
+
+def stat_record(file_path: Path) -> Optional[FileRecord]:
+    try:
+        return FileRecord.from_stat(file_path, os.stat(file_path))
+    except OSError:
+        return None
+
+
+SUFFIX_PATTERN = re.compile(r"^(.*)_([1-9]\d*)$")
+
+
+class DestinationIndex:
+    # Nomes existentes em cada pasta de destino, lidos uma única vez com os.scandir e
+    # atualizados conforme a execução cria ou remove arquivos. Troca exists() por set.
+    # normcase: no Windows "A.JPG" e "a.jpg" colidem.
+    # Também aloca nomes únicos: guarda o maior sufixo _N já usado por (pasta, nome, extensão),
+    # semeado pelos nomes existentes, e reserva os nomes que o plano vai criar.
+    # verify_on_disk: para índices de vida longa (modo observação), um nome que o índice dá
+    # como livre é conferido com um lstat, pois outro programa pode tê-lo criado depois.
+    # A origem de cada nome reservado fica em arrays, como no CompactPlan: pasta (número da
+    # DirectoryTable), nome num bytearray e stat; o FileRecord é montado só quando pedido.
+    def __init__(self, verify_on_disk: bool = False):
+        self.folders: Dict[str, Set[str]] = {}
+        self.counters: Dict[Tuple[str, str, str], int] = {}
+        self.planned: Dict[str, Dict[str, int]] = {}  # pasta -> nome -> linha dos arrays abaixo
+        self.planned_sources = DirectoryTable()
+        self.planned_folders = array("i")
+        self.planned_names = bytearray()
+        self.planned_name_ends = array("Q")
+        self.planned_stats = array("q")  # size, mtime_ns por linha
+        self.planned_ids = array("Q")  # ino, dev por linha
+        self.verify_on_disk = verify_on_disk
+
+    def names(self, folder: Path) -> Set[str]:
+        key = os.path.normcase(str(folder))
+        names = self.folders.get(key)
+        if names is None:
+            names = set()
+            try:
+                with os.scandir(folder) as it:
+                    for entry in it:
+                        self.remember(key, names, entry.name)
+            except OSError:  # Pasta ainda não existe
+                pass
+            self.folders[key] = names
+        return names
+
+    def remember(self, folder_key: str, names: Set[str], name: str) -> str:
+        # Devolve o nome normalizado, para ser reaproveitado como chave
+        name = os.path.normcase(name)
+        names.add(name)
+        stem, extension = os.path.splitext(name)
+        match = SUFFIX_PATTERN.match(stem)
+        if match:
+            key = (folder_key, match.group(1), extension)
+            self.counters[key] = max(self.counters.get(key, 0), int(match.group(2)))
+        return name
+
+    def exists(self, path: Path) -> bool:
+        names = self.names(path.parent)
+        if os.path.normcase(path.name) in names:
+            return True
+        if self.verify_on_disk and os.path.lexists(path):
+            self.remember(os.path.normcase(str(path.parent)), names, path.name)
+            return True
+        return False
+
+    def add(self, path: Path):
+        folder_key = os.path.normcase(str(path.parent))
+        names = self.folders.get(folder_key)
+        if names is not None:
+            self.remember(folder_key, names, path.name)
+
+    def discard(self, path: Path):
+        names = self.folders.get(os.path.normcase(str(path.parent)))
+        if names is not None:
+            names.discard(os.path.normcase(path.name))
+
+    def reserve(self, path: Path, record: FileRecord):
+        # O arquivo ainda não existe, mas o plano vai criá-lo a partir de record
+        folder_key = os.path.normcase(str(path.parent))
+        name = self.remember(folder_key, self.names(path.parent), path.name)
+        rows = self.planned.get(folder_key)
+        if rows is None:
+            rows = self.planned[folder_key] = {}
+        rows[name] = len(self.planned_folders)
+        self.planned_folders.append(self.planned_sources.intern(record.path.parent))
+        self.planned_names += record.path.name.encode("utf-8", "surrogatepass")
+        self.planned_name_ends.append(len(self.planned_names))
+        self.planned_stats.extend((record.size, record.mtime_ns))
+        self.planned_ids.extend((record.ino, record.dev))
+
+    def claim(self, path: Path):
+        # Nome que uma entrada do plano vai criar durante a execução; sem arquivo de referência
+        self.remember(os.path.normcase(str(path.parent)), self.names(path.parent), path.name)
+
+    def planned_record(self, path: Path) -> Optional[FileRecord]:
+        row = self.planned.get(os.path.normcase(str(path.parent)), {}).get(os.path.normcase(path.name))
+        if row is None:
+            return None
+        name = self.planned_names[self.planned_name_ends[row - 1] if row else 0:self.planned_name_ends[row]]
+        size, mtime_ns = self.planned_stats[2 * row:2 * row + 2]
+        ino, dev = self.planned_ids[2 * row:2 * row + 2]
+        return FileRecord(self.planned_sources[self.planned_folders[row]] / name.decode("utf-8", "surrogatepass"),
+                          size, mtime_ns, ino, dev)
+
+    def forget_planned(self):
+        # Depois da execução os nomes reservados já são arquivos no disco
+        self.planned.clear()
+        self.planned_sources = DirectoryTable()
+        self.planned_folders = array("i")
+        self.planned_names = bytearray()
+        self.planned_name_ends = array("Q")
+        self.planned_stats = array("q")
+        self.planned_ids = array("Q")
+
+    def allocate(self, dest_file: Path, record: FileRecord) -> Path:
+        # Próximo dest_file "nome_N.ext" livre, em O(1) por colisão, já reservado
+        folder_key = os.path.normcase(str(dest_file.parent))
+        stem, extension = os.path.splitext(dest_file.name)
+        key = (folder_key, os.path.normcase(stem), os.path.normcase(extension))
+        counter = self.counters.get(key, 0)
+        while True:
+            counter += 1
+            candidate = dest_file.parent / f"{stem}_{counter}{extension}"
+            if not self.exists(candidate):
+                break
+        self.counters[key] = counter
+        self.reserve(candidate, record)
+        return candidate
+
+
+def undo_action(action: Dict) -> str:
+    if action["action"] == "move":
+        # A pasta de origem pode ter saído inteira numa movimentação de pasta
+        Path(action["source"]).parent.mkdir(parents=True, exist_ok=True)
+        if os.path.lexists(action["source"]):  # rename sobrescreveria outro arquivo
+            raise FileExistsError(errno.EEXIST, "Origem já existe", action["source"])
+        try:
+            os.rename(action["dest"], action["source"])
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            copy_file(Path(action["dest"]), Path(action["source"]))
+            os.unlink(action["dest"])
+        return f"Desfeito: Movido {action['dest']} -> {action['source']}"
+    os.remove(action["dest"])
+    return f"Desfeito: Removido {action['dest']}"
+
+
+def undo_run(undo_log: UndoLog, workers: int = DEFAULT_TRANSFER_WORKERS,
+             per_device: int = DEFAULT_TRANSFERS_PER_DEVICE,
+             log: Optional[Callable[[str], None]] = None,
+             progress: Optional[Callable[[int, int], None]] = None,
+             cancelled: Optional[threading.Event] = None) -> int:
+    # Desfaz a execução inteira, da última transferência para a primeira, em paralelo e com
+    # o mesmo limite por disco da execução. Devolve quantas ações falharam.
+    log = log or (lambda message: None)
+    progress = progress or (lambda current, total: None)
+    limiter = DeviceLimiter(per_device)
+    lock = threading.Lock()
+    total = len(undo_log)
+    done = failures = 0
+
+    def step(action: Dict):
+        nonlocal done, failures
+        paths = [Path(action["dest"]), Path(action["source"])] if action["action"] == "move" else [Path(action["dest"])]
+        failed = False
+        with limiter.hold(paths):
+            try:
+                message = undo_action(action)
+            except FileExistsError as e:
+                if os.path.lexists(action["dest"]):
+                    message = f"Erro ao desfazer {action['dest']}: {e}"
+                    failed = True
+                else:  # Desfazer anterior interrompido: já voltou para a origem
+                    message = f"Já desfeito: {action['dest']}"
+            except FileNotFoundError as e:
+                if action["action"] == "copy" and os.path.lexists(action["source"]):
+                    message = f"Já desfeito: {action['dest']}"  # Cópia já removida
+                else:
+                    message = f"Erro ao desfazer {action['dest']}: {e}"
+                    failed = True
+            except OSError as e:
+                message = f"Erro ao desfazer {action['dest']}: {e}"
+                failed = True
+        log(message)
+        with lock:
+            done += 1
+            failures += failed
+            progress(done, total)
+
+    progress(0, total)
+    run_chains(undo_chains(undo_log), step, workers, cancelled or threading.Event())
+    return failures
+
+
+def undo_chains(undo_log: UndoLog) -> Iterator[List[Dict]]:
+    # Ações com o mesmo arquivo de destino (ex.: substituição de duplicata, que move duas origens
+    # para o mesmo nome) são desfeitas em ordem inversa por uma única thread; as demais rodam
+    # sozinhas. Três leituras do registro em disco, sem guardar todas as ações em memória:
+    # destinos repetidos (por hash; uma colisão só junta ações sem necessidade), ações desses
+    # destinos, e a passada que entrega as cadeias.
+    seen, shared = set(), set()
+    for action in undo_log.reversed_actions():
+        key = hash(os.path.normcase(action["dest"]))
+        (shared if key in seen else seen).add(key)
+    del seen
+    groups: Dict[str, List[Dict]] = {}
+    if shared:
+        for action in undo_log.reversed_actions():
+            if hash(os.path.normcase(action["dest"])) in shared:
+                groups.setdefault(os.path.normcase(action["dest"]), []).append(action)
+    for action in undo_log.reversed_actions():
+        key = os.path.normcase(action["dest"])
+        if key not in groups:
+            yield [action]
+        elif groups[key] is not None:
+            yield groups[key]
+            groups[key] = None  # A cadeia sai inteira na posição da primeira ação
+
+
+class FileOrganizer:
+    def __init__(self, options: Options,
+                 log: Optional[Callable[[str], None]] = None,
+                 progress: Optional[Callable[[int, int], None]] = None,
+                 confirm_delete: Optional[Callable[[Path], bool]] = None,
+                 undo_stack: Optional[List[Dict]] = None,
+                 hash_cache: Optional[HashCache] = None):
+        self.options = options
+        self.log = log or (lambda message: None)
+        self.progress = progress or (lambda current, total: None)
+        # Sem confirmação explícita nada é excluído permanentemente
+        self.confirm_delete = confirm_delete or (lambda path: False)
+        self.undo_stack = undo_stack if undo_stack is not None else []
+        self.comparator = DuplicateComparator(options.usar_hash, options.verificacao_rapida,
+                                              hash_cache if options.usar_cache_hash else None,
+                                              options.algoritmo_hash, options.buffer_hash_kb)
+        self.cancelled = threading.Event()
+        self.missing_origins = []
+        self.dest_index = DestinationIndex()
+        self.matches = FileFilter(options.filtro, options.usar_regex)
+        # Transferências em paralelo: índice e confirmação de exclusão são compartilhados
+        self.index_lock = threading.RLock()
+        self.confirm_lock = threading.Lock()
+        self.progress_lock = threading.Lock()
+        self.limiter = DeviceLimiter(options.transferencias_por_disco)
+        self.ready_folders: Set[str] = set()  # Pastas de destino já criadas nesta execução
+        self.journal: Optional[RunJournal] = None
+        self.entries: Sequence[PlanEntry] = CompactPlan()  # Plano em execução; as threads recebem só posições
+
+    def cancel(self):
+        # Pode ser chamado de outra thread; o laço para entre um arquivo e outro
+        self.cancelled.set()
+
+    def scan(self) -> List[FileRecord]:
+        # Varredura única: a mesma lista dá o total do progresso e alimenta o processamento
+        return list(self.iter_files())
+
+    def source_roots(self) -> List[Path]:
+        # Pastas de origem existentes, sem as repetidas e sem as que estão dentro de outra
+        # (a varredura da outra já passa por elas). Comparadas pelo caminho real, uma vez.
+        roots = [(origem, os.path.normcase(os.path.realpath(origem)))
+                 for origem in self.options.pastas_origem if origem.is_dir()]
+        result = []
+        for i, (origem, key) in enumerate(roots):
+            if not any((other == key and j < i) or key.startswith(other.rstrip(os.sep) + os.sep)
+                       for j, (_, other) in enumerate(roots) if j != i):
+                result.append(origem)
+        return result
+
+    def iter_files(self) -> Iterator[FileRecord]:
+        # Arquivos das origens conforme a varredura os encontra; para quando cancelado
+        for origem in self.source_roots():
+            for record in walk_files(origem, self.matches):
+                if self.cancelled.is_set():
+                    return
+                yield record
+
+    def dest_folder_for(self, file_path: Path) -> Path:
+        extension = file_path.suffix.lstrip('.').lower()
+        if self.options.usar_subpastas and extension:
+            return self.options.pasta_destino / extension
+        return self.options.pasta_destino
+
+    def locate(self, record: FileRecord) -> Tuple[Path, Optional[FileRecord]]:
+        dest_file = self.dest_folder_for(record.path) / record.path.name
+        if not self.dest_index.exists(dest_file):
+            return dest_file, None
+        # Nome reservado por outro arquivo deste plano: compara com a origem que vai ocupá-lo
+        dest_record = stat_record(dest_file) or self.dest_index.planned_record(dest_file)
+        if dest_record is None:
+            # Nome prometido a outra entrada ainda não executada: fica com o próximo nome livre
+            return self.dest_index.allocate(dest_file, record), None
+        return dest_file, dest_record
+
+    def resolve(self, record: FileRecord, dest_file: Path, dest_record: Optional[FileRecord],
+                comparison: Optional[Comparison] = None) -> PlanEntry:
+        opts = self.options
+        transfer = ACTION_MOVE if opts.mover_arquivos else ACTION_COPY
+        file_path = record.path
+        source_stat = record.fingerprint
+        if dest_record is None:
+            return PlanEntry(transfer, file_path, dest_file, source_stat=source_stat)
+        if opts.excluir_duplicatas:
+            if comparison is None:
+                comparison = self.comparator.compare(record, dest_record)
+            if comparison.is_duplicate:
+                if not opts.mover_arquivos:
+                    action, replace = ACTION_SKIP, False
+                # Mantém a cópia mais recente: se a origem for mais antiga ela é excluída
+                elif record.mtime_ns < dest_record.mtime_ns:
+                    action, replace = ACTION_DELETE, False
+                else:
+                    action, replace = transfer, True
+                return PlanEntry(action, file_path, dest_file, replace=replace, source_stat=source_stat,
+                                 dest_stat=dest_record.fingerprint, src_hash=comparison.src_hash,
+                                 dest_hash=comparison.dest_hash)
+        return PlanEntry(transfer, file_path, self.dest_index.allocate(dest_file, record), renamed=True, source_stat=source_stat)
+
+    def decide(self, record: FileRecord) -> PlanEntry:
+        return self.resolve(record, *self.locate(record))
+
+    def revalidate(self, entry: PlanEntry) -> PlanEntry:
+        if entry.action == ACTION_ERROR or entry.is_current():
+            return entry
+        record = stat_record(entry.source)
+        if record is None:
+            return PlanEntry(ACTION_ERROR, entry.source, message=f"Arquivo de origem não encontrado: {entry.source}")
+        # Origem ou destino mudou desde a pré-visualização: decide de novo só este arquivo
+        with self.index_lock:
+            if entry.dest is not None and entry.dest_stat is None and stat_fingerprint(entry.dest) is None:
+                self.dest_index.discard(entry.dest)  # Abre mão do nome reservado para esta entrada
+            return self.decide(record)
+
+    @contextmanager
+    def hashing(self):
+        # Pool de hash só enquanto o plano é montado
+        with HashPool(self.options.threads_hash, self.options.processos_hash) as pool:
+            self.comparator.pool = pool
+            try:
+                yield
+            finally:
+                self.comparator.pool = None
+
+    def content_duplicates(self, files: List[FileRecord]) -> Tuple[Dict[str, int], Dict[int, FileRecord]]:
+        # Agrupa por conteúdo todas as origens e o destino. Em cada grupo fica uma cópia: a que já
+        # está no destino ou, se não houver, a primeira origem. Devolve {origem duplicada: grupo}
+        # e {grupo: arquivo mantido}.
+        sizes = {record.size for record in files}
+        lixeira = os.path.normcase(str(self.options.pasta_destino / "Lixeira")) + os.sep
+        dest_records = [record for record in walk_files(self.options.pasta_destino, lambda name: True)
+                        if record.size in sizes and not os.path.normcase(str(record.path)).startswith(lixeira)]
+        dest_keys = {str(record.path) for record in dest_records}
+        duplicates, keepers = {}, {}
+        for group_id, group in enumerate(self.comparator.content_groups(files + dest_records)):
+            sources = [record for record in group if str(record.path) not in dest_keys]
+            if not sources:
+                continue
+            in_dest = [record for record in group if str(record.path) in dest_keys]
+            keepers[group_id] = in_dest[0] if in_dest else sources[0]
+            for record in sources if in_dest else sources[1:]:
+                duplicates[str(record.path)] = group_id
+        return duplicates, keepers
+
+    def content_duplicate_entry(self, record: FileRecord, keeper: FileRecord,
+                                keeper_entry: Optional[PlanEntry]) -> PlanEntry:
+        if keeper_entry is None:  # Cópia mantida já está no destino
+            target, target_stat = keeper.path, keeper.fingerprint
+        elif keeper_entry.action in (ACTION_SKIP, ACTION_DELETE):
+            target, target_stat = keeper_entry.dest, keeper_entry.dest_stat
+        else:  # Vai existir no destino depois que a entrada da cópia mantida for executada
+            target, target_stat = keeper_entry.dest, keeper_entry.source_stat
+        action = ACTION_DELETE if self.options.mover_arquivos else ACTION_SKIP
+        return PlanEntry(action, record.path, target, source_stat=record.fingerprint, dest_stat=target_stat,
+                         message=f"conteúdo igual a {target}")
+
+    def decide_many(self, records: List[FileRecord], folders: DirectoryTable,
+                    defer_hashes: bool = False) -> CompactPlan:
+        # Decide um lote de arquivos; as colisões de nome do lote são comparadas juntas, com
+        # hashes em paralelo. Com defer_hashes, colisões que dependem de ler o conteúdo viram
+        # entradas pendentes (resolve_pending) e o lote sai só com metadados.
+        opts = self.options
+        targets = []
+        for record in records:
+            dest_file, dest_record = self.locate(record)
+            if dest_record is None:
+                self.dest_index.reserve(dest_file, record)
+            targets.append((record, dest_file, dest_record))
+        comparisons = iter(())
+        if opts.excluir_duplicatas:
+            collisions = [(record, dest_record) for record, _, dest_record in targets if dest_record is not None]
+            if defer_hashes:
+                comparisons = iter([self.comparator.screen(record, dest_record) for record, dest_record in collisions])
+            else:
+                comparisons = iter(self.comparator.compare_many(collisions))
+        entries = CompactPlan(folders)
+        for record, dest_file, dest_record in targets:
+            comparison = next(comparisons) if dest_record is not None and opts.excluir_duplicatas else None
+            if comparison is None and dest_record is not None and opts.excluir_duplicatas:
+                transfer = ACTION_MOVE if opts.mover_arquivos else ACTION_COPY
+                entries.append(PlanEntry(transfer, record.path, dest_file, source_stat=record.fingerprint,
+                                         dest_stat=dest_record.fingerprint, pending=True))
+            else:
+                entries.append(self.resolve(record, dest_file, dest_record, comparison))
+        return entries
+
+    def resolve_pending(self, pending: List[Tuple[int, PlanEntry]],
+                        batch_size: int = PLAN_CHUNK) -> Iterator[List[Tuple[int, PlanEntry]]]:
+        # Compara as colisões adiadas na pré-visualização, em lotes, e devolve (posição, entrada
+        # decidida) com os hashes calculados. Roda sem o HashPool: os hashes são lidos na própria
+        # thread que chama (de baixa prioridade na interface). Arquivos que mudaram ficam
+        # pendentes e são decididos na execução. O cancelamento é checado a cada arquivo lido.
+        # No fim o índice do plano é liberado: era mantido só para estas comparações.
+        try:
+            yield from self.resolve_batches(pending, batch_size)
+        finally:
+            self.release_index()
+
+    def resolve_batches(self, pending: List[Tuple[int, PlanEntry]],
+                        batch_size: int) -> Iterator[List[Tuple[int, PlanEntry]]]:
+        for start in range(0, len(pending), batch_size):
+            if self.cancelled.is_set():
+                return
+            pairs, batch = [], []
+            for position, entry in pending[start:start + batch_size]:
+                record = stat_record(entry.source)
+                with self.index_lock:
+                    dest_record = stat_record(entry.dest) or self.dest_index.planned_record(entry.dest)
+                if record is None or dest_record is None or record.fingerprint != entry.source_stat \
+                        or dest_record.fingerprint != entry.dest_stat:
+                    continue
+                pairs.append((record, dest_record))
+                batch.append((position, entry))
+            comparisons = self.comparator.compare_many(pairs, cancelled=self.cancelled)
+            if self.cancelled.is_set():  # Lote interrompido no meio: sem hash não dá para decidir
+                return
+            resolved = []
+            with self.index_lock:
+                for (position, entry), (record, dest_record), comparison in zip(batch, pairs, comparisons):
+                    resolved.append((position, self.resolve(record, entry.dest, dest_record, comparison)))
+            yield resolved
+
+    def plan(self) -> CompactPlan:
+        entries = CompactPlan()
+        for chunk in self.plan_chunks(folders=entries.folders):
+            entries.extend(chunk)
+        self.release_index()
+        return entries
+
+    def release_index(self):
+        # Planejamento encerrado: as reservas (uma por arquivo) não servem mais; a execução
+        # começa com um índice novo
+        self.dest_index = DestinationIndex()
+
+    def plan_chunks(self, chunk_size: int = PLAN_CHUNK, folders: Optional[DirectoryTable] = None,
+                    defer_hashes: bool = False) -> Iterator[CompactPlan]:
+        # Plano em blocos, entregues à medida que a varredura avança: quem mostra o plano não
+        # espera a árvore inteira e pode parar no meio (cancel). Os blocos compartilham a
+        # mesma DirectoryTable. defer_hashes: ver decide_many.
+        folders = folders if folders is not None else DirectoryTable()
+        self.dest_index = DestinationIndex()
+        self.missing_origins = [origem for origem in self.options.pastas_origem if not origem.is_dir()]
+        errors = CompactPlan(folders)
+        for origem in self.missing_origins:
+            errors.append(PlanEntry(ACTION_ERROR, origem, message=f"Pasta de origem não encontrada: {origem}"))
+        if len(errors):
+            yield errors
+        with self.hashing():
+            if self.options.deduplicar_conteudo:
+                # Grupos de conteúdo precisam de todas as origens antes da primeira decisão
+                entries = self.plan_content_duplicates(folders)
+                for start in range(0, len(entries), chunk_size):
+                    if self.cancelled.is_set():
+                        return
+                    yield entries.select(range(start, min(start + chunk_size, len(entries))))
+                return
+            batch: List[FileRecord] = []
+            for record in self.iter_files():
+                batch.append(record)
+                if len(batch) >= chunk_size:
+                    yield self.decide_many(batch, folders, defer_hashes)
+                    batch = []
+            if batch and not self.cancelled.is_set():
+                yield self.decide_many(batch, folders, defer_hashes)
+
+    def plan_content_duplicates(self, folders: DirectoryTable) -> CompactPlan:
+        files = self.scan()
+        duplicates, keepers = self.content_duplicates(files)
+        # As entradas resolvidas vão para um plano compacto intermediário, na mesma tabela de
+        # pastas; as duplicatas de conteúdo entram depois, na ordem da varredura
+        targets = [record for record in files if str(record.path) not in duplicates]
+        resolved = self.decide_many(targets, folders)
+        kept = {str(keeper.path) for keeper in keepers.values()}
+        kept_positions = {str(record.path): position for position, record in enumerate(targets)
+                          if str(record.path) in kept}
+        del targets
+        promoted = self.confirm_keepers(files, duplicates, keepers, resolved, kept_positions, folders)
+        entries = CompactPlan(folders)
+        position = 0
+        for record in files:
+            key = str(record.path)
+            group_id = duplicates.get(key)
+            if key in promoted:
+                entries.append(promoted[key])
+            elif group_id is None:
+                entries.copy_from(resolved, position)
+                position += 1
+            else:
+                keeper = keepers[group_id]
+                keeper_entry = promoted.get(str(keeper.path))
+                if keeper_entry is None and str(keeper.path) in kept_positions:
+                    keeper_entry = resolved[kept_positions[str(keeper.path)]]
+                entries.append(self.content_duplicate_entry(record, keeper, keeper_entry))
+        return entries
+
+    def confirm_keepers(self, files: List[FileRecord], duplicates: Dict[str, int], keepers: Dict[int, FileRecord],
+                        resolved: CompactPlan, kept_positions: Dict[str, int],
+                        folders: DirectoryTable) -> Dict[str, PlanEntry]:
+        # As demais cópias do grupo só podem apontar para o destino da cópia mantida se esse
+        # destino tiver o mesmo conteúdo. Pular/excluir a cópia mantida pode vir só da regra
+        # "mesmo nome = duplicata" (sem hash); nesse caso os hashes são comparados e, se o
+        # conteúdo for outro, a próxima cópia do grupo passa a ser a mantida. Devolve as
+        # entradas das cópias promovidas, que deixam de ser duplicatas.
+        promoted: Dict[str, PlanEntry] = {}
+        members: Dict[int, List[FileRecord]] = {}
+        for record in files:
+            group_id = duplicates.get(str(record.path))
+            if group_id is not None:
+                members.setdefault(group_id, []).append(record)
+        for group_id, keeper in keepers.items():
+            position = kept_positions.get(str(keeper.path))
+            if position is None:  # Cópia mantida já está no destino
+                continue
+            entry = self.confirmed_entry(keeper, resolved[position])
+            if entry is not None:
+                resolved[position] = entry
+                continue
+            for record in members.get(group_id, []):
+                del duplicates[str(record.path)]
+                entry = self.decide_many([record], folders)[0]
+                confirmed = self.confirmed_entry(record, entry)
+                promoted[str(record.path)] = confirmed or entry
+                if confirmed is not None:
+                    keepers[group_id] = record  # As cópias seguintes do grupo apontam para esta
+                    break
+        return promoted
+
+    def confirmed_entry(self, record: FileRecord, entry: PlanEntry) -> Optional[PlanEntry]:
+        # Entrada da cópia mantida com o destino garantidamente igual (com os hashes), ou None
+        if entry.action not in (ACTION_SKIP, ACTION_DELETE):
+            return entry  # O próprio arquivo vai para o destino
+        if entry.src_hash and entry.src_hash == entry.dest_hash:
+            return entry
+        with self.index_lock:
+            dest_record = stat_record(entry.dest) or self.dest_index.planned_record(entry.dest)
+        if dest_record is None or dest_record.size != record.size:
+            return None
+        hashes = self.comparator.digests([record, dest_record], sample=False)
+        src_hash, dest_hash = hashes[str(record.path)], hashes[str(dest_record.path)]
+        if not src_hash or src_hash != dest_hash:
+            return None
+        entry.src_hash, entry.dest_hash = src_hash, dest_hash
+        return entry
+
+    def delete_duplicate(self, file_to_delete: Path) -> bool:
+        if self.remove_duplicate(file_to_delete):
+            with self.index_lock:
+                self.dest_index.discard(file_to_delete)
+            return True
+        return False
+
+    def remove_duplicate(self, file_to_delete: Path) -> bool:
+        if self.options.usar_lixeira:
+            try:
+                if send2trash is None:
+                    raise OSError("send2trash indisponível")
+                send2trash(str(file_to_delete))
+                self.log(f"Duplicata movida para lixeira: {file_to_delete}")
+            except Exception:
+                lixeira_local = self.options.pasta_destino / "Lixeira"
+                lixeira_local.mkdir(exist_ok=True)
+                shutil.move(file_to_delete, lixeira_local / file_to_delete.name)
+                self.log(f"Duplicata movida para lixeira local: {file_to_delete}")
+            return True
+        with self.confirm_lock:  # Uma pergunta por vez, mesmo com várias transferências em andamento
+            confirmed = self.confirm_delete(file_to_delete)
+        if confirmed:
+            file_to_delete.unlink()
+            self.log(f"Duplicata excluída permanentemente: {file_to_delete}")
+            return True
+        return False
+
+    def ensure_folder(self, folder: Path):
+        # Um mkdir por pasta de destino, não um por arquivo
+        key = str(folder)
+        if key not in self.ready_folders:
+            folder.mkdir(parents=True, exist_ok=True)
+            self.ready_folders.add(key)
+
+    def same_device(self, src: Path, dest: Path) -> bool:
+        return self.limiter.device_of(src) == self.limiter.device_of(dest)
+
+    def move_file(self, src: Path, dest: Path) -> str:
+        # Mesmo disco: rename, só muda a entrada de diretório. Entre discos: cópia + exclusão.
+        if self.same_device(src, dest):
+            try:
+                os.rename(src, dest)
+                return "rename"
+            except OSError as e:
+                if e.errno != errno.EXDEV:  # Ex.: bind mount com o mesmo st_dev; qualquer outro erro sobe
+                    raise
+        method = copy_file(src, dest)
+        os.unlink(src)
+        return method
+
+    def move_or_copy_file(self, src: Path, dest: Path, move: bool) -> Dict:
+        self.ensure_folder(dest.parent)
+        if move:
+            method = self.move_file(src, dest)
+            undo = {"action": "move", "source": str(src), "dest": str(dest)}
+            self.log(f"Movido ({method}): {src} -> {dest}")
+        else:
+            method = copy_file(src, dest)
+            undo = {"action": "copy", "source": str(src), "dest": str(dest)}
+            self.log(f"Copiado ({method}): {src} -> {dest}")
+        self.undo_stack.append(undo)
+        with self.index_lock:
+            self.dest_index.add(dest)
+            if move:
+                self.dest_index.discard(src)
+        return undo
+
+    def apply(self, entry: PlanEntry) -> Optional[Dict]:
+        # Devolve a ação de desfazer da transferência feita, se houve uma
+        if entry.action == ACTION_ERROR:
+            self.log(entry.message)
+        elif entry.action == ACTION_SKIP:
+            self.log(f"Pulado duplicata: {entry.source}")
+        elif entry.action == ACTION_DELETE:
+            self.delete_duplicate(entry.source)
+        elif entry.replace and not self.delete_duplicate(entry.dest):
+            self.log(f"Duplicata mantida, pulando: {entry.source}")
+        else:
+            return self.move_or_copy_file(entry.source, entry.dest, entry.action == ACTION_MOVE)
+        return None
+
+    def run_entry(self, position: int):
+        if self.journal is not None:
+            self.journal.intent(position)
+        entry = self.revalidate(self.entries[position])
+        with self.limiter.hold(self.transfer_paths(entry)):
+            undo = self.apply(entry)
+        if self.journal is not None:
+            self.journal.done(position, undo)
+
+    def directory_moves(self, positions: Iterable[int]) -> Dict[str, List[int]]:
+        # Subpastas de origem que podem sair inteiras com um único rename: todos os arquivos
+        # da pasta vão, sem renomear nem substituir, para a mesma pasta de destino, que ainda
+        # não existe, fica no mesmo disco e não recebe nada de outra pasta. As pastas de
+        # origem informadas ficam onde estão.
+        if not self.options.mover_arquivos:
+            return {}
+        roots = {os.path.normcase(str(origem)) for origem in self.options.pastas_origem}
+        by_folder: Dict[str, List[int]] = {}
+        blocked: Set[str] = set()
+        senders: Dict[str, Set[str]] = {}  # Pasta de destino -> pastas de origem que mandam algo para ela
+        for position in positions:
+            entry = self.entries[position]
+            source_key = os.path.normcase(str(entry.source.parent))
+            if entry.dest is not None:
+                senders.setdefault(os.path.normcase(str(entry.dest.parent)), set()).add(source_key)
+            if entry.action == ACTION_MOVE and not entry.replace and not entry.renamed:
+                by_folder.setdefault(source_key, []).append(position)
+            else:
+                blocked.add(source_key)
+        moves = {}
+        for source_key, group in by_folder.items():
+            first = self.entries[group[0]]
+            folder, dest_folder = first.source.parent, first.dest.parent
+            if (source_key in blocked or source_key in roots
+                    or senders[os.path.normcase(str(dest_folder))] != {source_key}
+                    or os.path.lexists(dest_folder)
+                    or not self.same_device(first.source, first.dest)
+                    or not all(self.entries[position].is_current() for position in group)):
+                continue
+            try:
+                with os.scandir(folder) as it:
+                    contents = [(item.name, item.is_file(follow_symlinks=False)) for item in it]
+            except OSError:
+                continue
+            # Nada além dos arquivos do plano: sem subpastas nem arquivos fora do filtro
+            if all(is_file for _, is_file in contents) and \
+                    sorted(name for name, _ in contents) == sorted(self.entries[position].source.name
+                                                                   for position in group):
+                moves[str(folder)] = group
+        return moves
+
+    def move_directory(self, group: List[int]) -> bool:
+        first = self.entries[group[0]]
+        folder, dest_folder = first.source.parent, first.dest.parent
+        if self.journal is not None:
+            self.journal.intent(*group)
+        try:
+            self.ensure_folder(dest_folder.parent)
+            os.rename(folder, dest_folder)
+        except OSError:  # Pasta mudou ou foi criada no meio tempo: volta arquivo por arquivo
+            return False
+        with self.index_lock:
+            for position in group:
+                entry = self.entries[position]
+                undo = {"action": "move", "source": str(entry.source), "dest": str(entry.dest)}
+                self.undo_stack.append(undo)
+                self.dest_index.add(entry.dest)
+                if self.journal is not None:
+                    self.journal.done(position, undo)
+        self.ready_folders.add(str(dest_folder))
+        self.log(f"Pasta movida (rename): {folder} -> {dest_folder} ({len(group)} arquivos)")
+        return True
+
+    def transfer_paths(self, entry: PlanEntry) -> List[Path]:
+        # Arquivos cujo disco a entrada ocupa; pular e registrar erro não tocam em disco
+        if entry.action in (ACTION_COPY, ACTION_MOVE):
+            return [entry.source, entry.dest]
+        if entry.action == ACTION_DELETE:
+            return [entry.source]
+        return []
+
+    def chain_key(self, position: int) -> str:
+        entries = self.entries
+        if isinstance(entries, CompactPlan):
+            return os.path.normcase(entries.dest_text(position) or entries.source_text(position))
+        entry = entries[position]
+        return os.path.normcase(str(entry.dest or entry.source))
+
+    def chains(self, positions: Sequence[int]) -> Iterator[List[int]]:
+        # Entradas com o mesmo arquivo de destino (substituição, duplicatas de conteúdo que
+        # apontam para a cópia mantida) dependem umas das outras e rodam em ordem. Só destinos
+        # que já existem ou que são alvo de duplicatas podem ser compartilhados; as demais
+        # entradas reservaram nomes novos e rodam sozinhas, sem guardar uma chave por arquivo.
+        shared: Set[str] = set()
+        for position in positions:
+            entry = self.entries[position]
+            if entry.action in (ACTION_SKIP, ACTION_DELETE) or entry.replace or entry.pending:
+                shared.add(self.chain_key(position))
+        groups: Dict[str, List[int]] = {}
+        if shared:
+            for position in positions:
+                key = self.chain_key(position)
+                if key in shared:
+                    groups.setdefault(key, []).append(position)
+        for position in positions:
+            key = self.chain_key(position) if shared else None
+            if key not in shared:
+                yield [position]
+            elif key in groups:
+                yield groups.pop(key)  # A cadeia sai inteira na posição da primeira entrada
+
+    def process(self, positions: Sequence[int]):
+        total = len(positions)
+        self.progress(0, total)
+        if self.options.threads_transferencia <= 1:
+            for current, position in enumerate(positions, 1):
+                if self.cancelled.is_set():
+                    break
+                self.progress(current, total)
+                self.run_entry(position)
+        else:
+            done = 0
+
+            def step(position: int):
+                nonlocal done
+                self.run_entry(position)
+                with self.progress_lock:
+                    done += 1
+                    self.progress(done, total)
+
+            run_chains(self.chains(positions), step, self.options.threads_transferencia, self.cancelled)
+        self.log("Processamento cancelado." if self.cancelled.is_set() else "Processamento concluído.")
+
+    def execute(self, entries: Sequence[PlanEntry], resume: Optional[JournalState] = None,
+                keep_index: bool = False):
+        # Executa exatamente o plano da pré-visualização, sem nova varredura. O índice começa
+        # vazio: as reservas do plano não valem mais, o que conta é o disco. Os nomes novos do
+        # plano ficam prometidos às suas entradas, para que uma entrada decidida de novo em
+        # outra thread não escolha o mesmo nome.
+        # Com resume, continua a execução gravada no diário: entradas concluídas são puladas.
+        # keep_index: o plano foi decidido agora com o índice atual, que continua valendo
+        # (modo observação, lote a lote, sem reler as pastas de destino).
+        if not keep_index:
+            self.dest_index = DestinationIndex()
+        self.ready_folders = set()
+        self.entries = entries
+        positions = array("L", range(len(entries)))
+        if resume is not None:
+            self.journal = RunJournal(resume.path)
+            positions = self.recover(array("L", (p for p in positions if p not in resume.done)), resume)
+        elif self.options.diario_execucao:
+            undo = self.undo_stack.path if isinstance(self.undo_stack, UndoLog) else None
+            self.journal = RunJournal.create(JOURNAL_DIR, self.options.to_template(),
+                                             (entry.to_dict() for entry in entries), str(undo) if undo else None)
+        finished = False
+        try:
+            for position in positions:
+                entry = entries[position]
+                if entry.action in (ACTION_COPY, ACTION_MOVE) and entry.dest_stat is None:
+                    self.dest_index.claim(entry.dest)
+            moved = set()
+            for group in self.directory_moves(positions).values():
+                if self.cancelled.is_set():
+                    break
+                if self.move_directory(group):
+                    moved.update(group)
+            if moved:
+                positions = array("L", (p for p in positions if p not in moved))
+            self.process(positions)
+            finished = not self.cancelled.is_set()
+        finally:
+            if self.journal is not None:
+                self.journal.close(finished)
+                if not finished:
+                    self.log(f"Execução pode ser retomada a partir do diário: {self.journal.path}")
+                self.journal = None
+
+    def recover(self, positions: Sequence[int], resume: JournalState) -> array:
+        # Devolve as posições que ainda faltam. Sem "done" no diário não quer dizer que não
+        # foram feitas: o fsync em lotes pode ter perdido os últimos registros. Pelo mesmo motivo
+        # o .parcial é removido de toda entrada sem "done", não só das que têm "intent".
+        for undo in resume.done.values():
+            if undo is not None:
+                self.undo_stack.append(undo)
+        remaining = array("L")
+        for position in positions:
+            entry = self.entries[position]
+            if entry.dest is not None:
+                # Cópia interrompida: o arquivo temporário fica para trás, o nome final não
+                partial_path(entry.dest).unlink(missing_ok=True)
+            if not entry.already_applied():
+                remaining.append(position)
+                continue
+            undo = None
+            if entry.action in (ACTION_COPY, ACTION_MOVE):
+                undo = {"action": entry.action, "source": str(entry.source), "dest": str(entry.dest)}
+                self.undo_stack.append(undo)
+            self.journal.done(position, undo)
+        self.log(f"Retomando execução: {len(self.entries) - len(remaining)} entradas já concluídas, "
+                 f"{len(remaining)} restantes ({len(resume.started)} interrompidas no meio).")
+        return remaining
+
+    def run(self):
+        # Planeja tudo de uma vez (hashes em lote) e executa; a revalidação por stat cobre
+        # colisões entre arquivos do próprio lote
+        self.execute(self.plan())
@@ -0,0 +1,256 @@
+import os
+import hashlib
+import itertools
+import sqlite3
+import threading
+from collections import defaultdict
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+try:
+    import xxhash
+except ImportError:  # Hash rápido não criptográfico é opcional
+    xxhash = None
+
+# Hashes de arquivos e comparação de duplicatas; cache persistente em SQLite ao lado do config.ini
+COMMIT_EVERY = 500
+SAMPLE_SIZE = 64 * 1024  # Início e fim lidos na amostra antes do hash completo
+DEFAULT_BUFFER_KB = 1024
+
+HASH_ALGORITHMS = {
+    "md5": hashlib.md5,
+    "sha256": hashlib.sha256,
+    "blake2b": hashlib.blake2b,
+}
+if xxhash is not None:
+    HASH_ALGORITHMS["xxh3_128"] = xxhash.xxh3_128
+DEFAULT_HASH_ALGORITHM = "md5"
+DEFAULT_HASH_WORKERS = min(8, os.cpu_count() or 1)
+
+_buffers = threading.local()
+
+
+def get_read_buffer(size: int) -> bytearray:
+    # Um bytearray reaproveitado por thread: leituras com readinto sem alocar a cada bloco
+    buffer = getattr(_buffers, "buffer", None)
+    if buffer is None or len(buffer) != size:
+        buffer = _buffers.buffer = bytearray(size)
+    return buffer
+
+
+class HashCache:
+    # Chave: caminho + algoritmo. O digest só é reaproveitado se (dev, inode, tamanho,
+    # mtime_ns) ainda baterem; qualquer mudança no arquivo invalida a entrada.
+    def __init__(self, db_path: Path):
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.conn = sqlite3.connect(str(db_path), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS hashes (
+                path TEXT NOT NULL,
+                algorithm TEXT NOT NULL,
+                dev INTEGER NOT NULL,
+                ino INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                digest TEXT NOT NULL,
+                PRIMARY KEY (path, algorithm)
+            )""")
+        self.conn.commit()
+
+    def get(self, record, algorithm: str) -> Optional[str]:
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT dev, ino, size, mtime_ns, digest FROM hashes WHERE path = ? AND algorithm = ?",
+                (str(record.path), algorithm)).fetchone()
+        if row is None or row[:4] != (record.dev, record.ino, record.size, record.mtime_ns):
+            return None
+        return row[4]
+
+    def put(self, record, algorithm: str, digest: str):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO hashes (path, algorithm, dev, ino, size, mtime_ns, digest) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (str(record.path), algorithm, record.dev, record.ino, record.size, record.mtime_ns, digest))
+            self.pending += 1
+            if self.pending >= COMMIT_EVERY:
+                self.conn.commit()
+                self.pending = 0
+
+    def close(self):
+        with self.lock:
+            self.conn.commit()
+            self.conn.close()
+
+
+def get_file_hash(file_path: Path, algorithm: str = DEFAULT_HASH_ALGORITHM,
+                  buffer_size: int = DEFAULT_BUFFER_KB * 1024) -> Optional[str]:
+    buffer = get_read_buffer(buffer_size)
+    view = memoryview(buffer)
+    try:
+        hasher = HASH_ALGORITHMS[algorithm]()
+        with open(file_path, "rb", buffering=0) as f:
+            while True:
+                n = f.readinto(buffer)
+                if not n:
+                    break
+                hasher.update(view[:n])
+        return hasher.hexdigest().lower()
+    except OSError:
+        return None
+    finally:
+        view.release()
+
+
+def get_sample_hash(file_path: Path, size: int, algorithm: str = DEFAULT_HASH_ALGORITHM) -> Optional[str]:
+    # Hash do tamanho + primeiros e últimos SAMPLE_SIZE bytes
+    try:
+        with file_path.open("rb") as f:
+            hasher = HASH_ALGORITHMS[algorithm](str(size).encode())
+            hasher.update(f.read(SAMPLE_SIZE))
+            f.seek(-SAMPLE_SIZE, 2)
+            hasher.update(f.read(SAMPLE_SIZE))
+        return hasher.hexdigest().lower()
+    except OSError:
+        return None
+
+
+class Comparison(NamedTuple):
+    is_duplicate: bool
+    src_hash: Optional[str] = None
+    dest_hash: Optional[str] = None
+
+
+class HashPool:
+    # Pool limitado para calcular vários hashes ao mesmo tempo. Threads bastam na maioria
+    # dos casos (hashlib e a leitura liberam o GIL); processos são opcionais.
+    def __init__(self, workers: int = DEFAULT_HASH_WORKERS, processes: bool = False):
+        executor = ProcessPoolExecutor if processes else ThreadPoolExecutor
+        self.executor: Executor = executor(max_workers=max(1, workers))
+
+    def submit_full(self, record, algorithm: str, buffer_size: int):
+        return self.executor.submit(get_file_hash, record.path, algorithm, buffer_size)
+
+    def submit_sample(self, record, algorithm: str):
+        return self.executor.submit(get_sample_hash, record.path, record.size, algorithm)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self) -> "HashPool":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+
+
+class DuplicateComparator:
+    # Comparação em camadas, da mais barata para a mais cara:
+    #   1. tamanhos diferentes => não é duplicata (nenhuma leitura)
+    #   2. verificação rápida: mesmo tamanho e mesmo mtime (em segundos, como o rsync) => duplicata
+    #   3. arquivos grandes: hash de uma amostra (início + fim); amostras diferentes => não é duplicata
+    #   4. hash do conteúdo, só para quem sobrou
+    # Sem hash e sem verificação rápida vale o comportamento antigo: mesmo nome => duplicata.
+    # compare_many processa cada camada em lote, usando o HashPool quando houver um.
+    def __init__(self, use_hash: bool, quick_check: bool, hash_cache: Optional[HashCache] = None,
+                 algorithm: str = DEFAULT_HASH_ALGORITHM, buffer_kb: int = DEFAULT_BUFFER_KB):
+        self.use_hash = use_hash
+        self.quick_check = quick_check
+        self.hash_cache = hash_cache
+        self.algorithm = algorithm
+        self.buffer_size = buffer_kb * 1024
+        self.pool: Optional[HashPool] = None
+
+    def screen(self, source, dest) -> Optional[Comparison]:
+        # Camadas que não leem conteúdo; None significa que é preciso calcular hashes
+        if not self.use_hash and not self.quick_check:
+            return Comparison(True)
+        if source.size != dest.size:
+            return Comparison(False)
+        if self.quick_check and source.mtime_ns // 1_000_000_000 == dest.mtime_ns // 1_000_000_000:
+            return Comparison(True)
+        if not self.use_hash:
+            return Comparison(False)
+        return None
+
+    def digests(self, records: Sequence, sample: bool,
+                cancelled: Optional[threading.Event] = None) -> Dict[str, Optional[str]]:
+        # Um hash por caminho, mesmo que o arquivo apareça em vários pares. Com cancelled, a
+        # leitura sequencial para no próximo arquivo e os restantes ficam sem hash (None).
+        algorithm = f"{self.algorithm}-amostra" if sample else self.algorithm
+        result = {}
+        missing = []
+        for record in records:
+            key = str(record.path)
+            if key in result:
+                continue
+            result[key] = self.hash_cache.get(record, algorithm) if self.hash_cache is not None else None
+            if result[key] is None:
+                missing.append(record)
+        if self.pool is not None:
+            futures = [self.pool.submit_sample(r, self.algorithm) if sample
+                       else self.pool.submit_full(r, self.algorithm, self.buffer_size) for r in missing]
+            computed = (future.result() for future in futures)
+        else:
+            remaining = missing if cancelled is None else itertools.takewhile(lambda r: not cancelled.is_set(), missing)
+            computed = (get_sample_hash(r.path, r.size, self.algorithm) if sample
+                        else get_file_hash(r.path, self.algorithm, self.buffer_size) for r in remaining)
+        for record, digest in zip(missing, computed):
+            result[str(record.path)] = digest
+            if digest is not None and self.hash_cache is not None:
+                self.hash_cache.put(record, algorithm, digest)
+        return result
+
+    def compare_many(self, pairs: Sequence[Tuple], cancelled: Optional[threading.Event] = None) -> List[Comparison]:
+        # Se cancelled for acionado no meio, os resultados ficam incompletos e devem ser descartados
+        results = [self.screen(source, dest) for source, dest in pairs]
+        pending = [i for i, result in enumerate(results) if result is None]
+        large = [i for i in pending if pairs[i][0].size > 2 * SAMPLE_SIZE]
+        if large:
+            samples = self.digests([record for i in large for record in pairs[i]], sample=True, cancelled=cancelled)
+            for i in large:
+                src_sample = samples[str(pairs[i][0].path)]
+                if src_sample is None or src_sample != samples[str(pairs[i][1].path)]:
+                    results[i] = Comparison(False)
+            pending = [i for i in pending if results[i] is None]
+        if pending:
+            hashes = self.digests([record for i in pending for record in pairs[i]], sample=False, cancelled=cancelled)
+            for i in pending:
+                src_hash = hashes[str(pairs[i][0].path)]
+                dest_hash = hashes[str(pairs[i][1].path)]
+                results[i] = Comparison(bool(src_hash and dest_hash and src_hash == dest_hash), src_hash, dest_hash)
+        return results
+
+    def compare(self, source, dest) -> Comparison:
+        return self.compare_many([(source, dest)])[0]
+
+    def content_groups(self, records: Sequence) -> List[List]:
+        # Agrupa por conteúdo idêntico: tamanho, depois amostra (arquivos grandes), depois hash
+        # completo. Só grupos com mais de um arquivo; a ordem de entrada é mantida em cada grupo.
+        by_size = defaultdict(list)
+        for record in records:
+            by_size[record.size].append(record)
+        groups = [group for group in by_size.values() if len(group) > 1]
+        large = [record for group in groups if group[0].size > 2 * SAMPLE_SIZE for record in group]
+        if large:
+            samples = self.digests(large, sample=True)
+            groups = split_groups(groups, lambda r: samples[str(r.path)] if r.size > 2 * SAMPLE_SIZE else "")
+        hashes = self.digests([record for group in groups for record in group], sample=False)
+        return split_groups(groups, lambda r: hashes[str(r.path)])
+
+
+def split_groups(groups: List[List], key: Callable) -> List[List]:
+    # Subdivide cada grupo pela chave; registros sem chave (erro de leitura) ficam de fora
+    result = []
+    for group in groups:
+        buckets = defaultdict(list)
+        for record in group:
+            value = key(record)
+            if value is not None:
+                buckets[value].append(record)
+        result.extend(bucket for bucket in buckets.values() if len(bucket) > 1)
+    return result
@@ -0,0 +1,132 @@
+import os
+import json
+import time
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Set
+
+# Diário de execução (write-ahead): um arquivo JSON Lines por execução. A primeira linha guarda
+# as opções e o número de entradas, seguida de uma linha por entrada do plano (gravadas e lidas
+# uma a uma, sem montar o plano inteiro em JSON); depois vem "intent" antes de cada entrada e
+# "done" quando ela termina, com a ação de desfazer. Os dois vão para o disco (fsync) em lotes:
+# uma queda perde no máximo os últimos, e a retomada confere pelo stat as entradas sem "done"
+# (a cópia é gravada num .parcial e só ganha o nome final completa).
+JOURNAL_VERSION = 2
+JOURNAL_SUFFIX = ".journal"
+FSYNC_EVERY = 256
+FSYNC_SECONDS = 1.0
+
+RECORD_INTENT = "i"
+RECORD_DONE = "d"
+
+
+class JournalState(NamedTuple):
+    path: Path
+    options: Dict
+    done: Dict[int, Optional[Dict]]  # Índice da entrada -> ação de desfazer (None se não há)
+    started: Set[int]  # Entradas com "intent" e sem "done": interrompidas no meio
+    undo: Optional[str]  # Registro de desfazer da execução, se havia um
+
+
+class RunJournal:
+    def __init__(self, path: Path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.file = path.open("a", encoding="utf-8")
+        self.pending = 0
+        self.last_sync = time.monotonic()
+
+    @classmethod
+    def create(cls, folder: Path, options: Dict, entries: Iterable[Dict], undo: Optional[str] = None) -> "RunJournal":
+        folder.mkdir(parents=True, exist_ok=True)
+        path = folder / f"execucao-{datetime.now():%Y%m%d-%H%M%S-%f}{JOURNAL_SUFFIX}"
+        journal = cls(path)
+        with journal.lock:
+            journal.file.write(encode({"version": JOURNAL_VERSION, "options": options, "undo": undo}))
+            count = 0
+            for entry in entries:
+                journal.file.write(encode(entry))
+                count += 1
+            journal.file.write(encode({"count": count}))  # Fecha o plano: sem esta linha o diário não é retomado
+            journal.sync_locked()  # O plano precisa estar no disco antes da primeira transferência
+        return journal
+
+    def write(self, *records: Dict):
+        lines = "".join(encode(record) for record in records)
+        with self.lock:
+            self.file.write(lines)
+            self.pending += len(records)
+            if self.pending >= FSYNC_EVERY or time.monotonic() - self.last_sync >= FSYNC_SECONDS:
+                self.sync_locked()
+
+    def intent(self, *indexes: int):
+        # "intent" sem "done" na retomada: a entrada pode ter ficado pela metade
+        self.write(*({"t": RECORD_INTENT, "n": index} for index in indexes))
+
+    def done(self, index: int, undo: Optional[Dict] = None):
+        record = {"t": RECORD_DONE, "n": index}
+        if undo is not None:
+            record["u"] = undo
+        self.write(record)
+
+    def sync(self):
+        with self.lock:
+            self.sync_locked()
+
+    def sync_locked(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.pending = 0
+        self.last_sync = time.monotonic()
+
+    def close(self, finished: bool):
+        # Execução concluída não precisa de retomada: o diário é apagado
+        with self.lock:
+            self.sync_locked()
+            self.file.close()
+        if finished:
+            self.path.unlink(missing_ok=True)
+
+
+def encode(record: Dict) -> str:
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+
+
+def read_journal(path: Path, add_entry: Callable[[Dict], None]) -> JournalState:
+    # Cada entrada do plano é entregue a add_entry assim que lida
+    done: Dict[int, Optional[Dict]] = {}
+    started: Set[int] = set()
+    with path.open("r", encoding="utf-8") as f:
+        header = json.loads(f.readline())
+        if header.get("version") != JOURNAL_VERSION:
+            raise ValueError(f"Versão de diário não suportada: {header.get('version')}")
+        count = 0
+        for line in f:
+            record = json.loads(line)
+            if "count" in record and "action" not in record:
+                if record["count"] != count:
+                    raise ValueError(f"Diário incompleto: {path}")
+                break
+            add_entry(record)
+            count += 1
+        else:
+            raise ValueError(f"Diário incompleto: {path}")
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:  # Última linha cortada pela queda
+                break
+            if record["t"] == RECORD_INTENT:
+                started.add(record["n"])
+            else:
+                started.discard(record["n"])
+                done[record["n"]] = record.get("u")
+    return JournalState(path, header["options"], done, started, header.get("undo"))
+
+
+def pending_journals(folder: Path) -> List[Path]:
+    # Diários que sobraram de execuções interrompidas, do mais recente para o mais antigo
+    if not folder.is_dir():
+        return []
+    return sorted(folder.glob(f"*{JOURNAL_SUFFIX}"), reverse=True)
@@ -0,0 +1,58 @@
+import threading
+import logging
+from collections import deque
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+from typing import List
+
+# Log da interface: cada mensagem vai direto para um arquivo rotativo (histórico completo,
+# com tamanho limitado em disco) e para um buffer circular com as últimas linhas, que a tela
+# busca em lotes. Execuções longas ficam com memória constante.
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_BACKUPS = 5
+LOG_VIEW_LINES = 5000  # Linhas mantidas na tela (QPlainTextEdit.setMaximumBlockCount)
+LOG_FORMAT = "%(asctime)s\t%(threadName)s\t%(message)s"
+
+
+class LogSink:
+    def __init__(self, path: Path, view_lines: int = LOG_VIEW_LINES):
+        self.path = path
+        self.lock = threading.Lock()
+        self.pending = deque(maxlen=view_lines)  # Linhas antigas saem da tela, não do arquivo
+        self.handler = RotatingFileHandler(path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS,
+                                           encoding="utf-8", delay=True)
+        self.handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        self.logger = logging.getLogger(f"organizador.{id(self)}")
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        self.logger.addHandler(self.handler)
+
+    def write(self, message: str):
+        # Pode ser chamado de qualquer thread
+        self.logger.info(message)
+        with self.lock:
+            self.pending.append(message)
+
+    def take(self) -> List[str]:
+        with self.lock:
+            lines = list(self.pending)
+            self.pending.clear()
+        return lines
+
+    def files(self) -> List[Path]:
+        # Do mais antigo para o mais recente: organizador.log.5 ... organizador.log.1, organizador.log
+        backups = [Path(f"{self.path}.{n}") for n in range(LOG_BACKUPS, 0, -1)]
+        return [path for path in backups + [self.path] if path.exists()]
+
+    def export(self, dest: Path):
+        # Copia o histórico do disco, não a tela: inclui as linhas que já saíram do buffer
+        self.handler.flush()
+        with open(dest, "wb") as out:
+            for path in self.files():
+                with open(path, "rb") as f:
+                    while chunk := f.read(1024 * 1024):
+                        out.write(chunk)
+
+    def close(self):
+        self.logger.removeHandler(self.handler)
+        self.handler.close()
@@ -0,0 +1,133 @@
+from array import array
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from PyQt6.QtCore import QAbstractListModel, QModelIndex, Qt
+
+from organizer_engine import CompactPlan, Options, PlanEntry
+
+# Pré-visualização sem um QListWidgetItem por ação: o modelo guarda o plano compacto, um mapa
+# de exclusão (1 byte por entrada) e a lista de posições visíveis (array de inteiros, já
+# filtrada e ordenada). O texto de cada linha só é montado quando a view pede.
+SORT_KEYS: Dict[str, Optional[Callable[[CompactPlan, int], object]]] = {
+    "Ordem do plano": None,
+    "Ação": lambda plan, i: plan.actions[i],
+    "Origem": lambda plan, i: plan.source_text(i).lower(),
+    "Destino": lambda plan, i: plan.dest_text(i).lower(),
+}
+
+
+class PlanListModel(QAbstractListModel):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.entries = CompactPlan()
+        self.options: Optional[Options] = None
+        self.excluded = bytearray()
+        self.rows = array("L")
+        self.filter_text = ""
+        self.sort_name = next(iter(SORT_KEYS))
+        self.streaming = False  # Plano ainda chegando: linhas novas vão para o fim, sem ordenar
+
+    def rowCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.rows)
+
+    def data(self, index: QModelIndex, role: int = Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or index.row() >= len(self.rows):
+            return None
+        entry = self.entries[self.rows[index.row()]]
+        if role == Qt.ItemDataRole.DisplayRole:
+            return entry.describe(self.options)
+        if role == Qt.ItemDataRole.UserRole:
+            return entry
+        return None
+
+    def set_plan(self, entries: CompactPlan, options: Optional[Options]):
+        self.beginResetModel()
+        self.streaming = False
+        self.entries = entries
+        self.options = options
+        self.excluded = bytearray(len(entries))
+        self.rows = self.visible_rows()
+        self.endResetModel()
+
+    def clear(self):
+        self.set_plan(CompactPlan(), None)
+
+    def visible_rows(self) -> array:
+        # Uma passada pelo plano; ordenação só quando pedida
+        plan = self.entries
+        matches = plan.text_matcher(self.filter_text) if self.filter_text else None
+        positions = [i for i in range(len(plan)) if not self.excluded[i] and (matches is None or matches(i))]
+        key = SORT_KEYS[self.sort_name]
+        if key is not None and not self.streaming:
+            positions.sort(key=lambda i: key(plan, i))
+        return array("L", positions)
+
+    def start_stream(self, options: Options) -> CompactPlan:
+        # Plano vazio que os blocos do worker vão preenchendo (mesma tabela de pastas)
+        self.set_plan(CompactPlan(), options)
+        self.streaming = True
+        return self.entries
+
+    def append_chunk(self, chunk: CompactPlan):
+        # Só as linhas novas entram na view; as que já estão na tela não mudam
+        plan = self.entries
+        start = len(plan)
+        plan.extend(chunk)
+        self.excluded.extend(bytes(len(chunk)))
+        matches = plan.text_matcher(self.filter_text) if self.filter_text else None
+        positions = [i for i in range(start, len(plan)) if matches is None or matches(i)]
+        if positions:
+            first = len(self.rows)
+            self.beginInsertRows(QModelIndex(), first, first + len(positions) - 1)
+            self.rows.extend(positions)
+            self.endInsertRows()
+
+    def apply_resolved(self, results: Iterable[Tuple[int, PlanEntry]]):
+        # Decisões das colisões verificadas em segundo plano; as linhas ficam onde estão
+        changed = False
+        for position, entry in results:
+            self.entries[position] = entry
+            changed = True
+        if changed and self.rows:
+            self.dataChanged.emit(self.index(0), self.index(len(self.rows) - 1),
+                                  [Qt.ItemDataRole.DisplayRole])
+
+    def finish_stream(self):
+        # A ordenação escolhida é aplicada uma vez, com o plano completo
+        self.streaming = False
+        if SORT_KEYS[self.sort_name] is not None:
+            self.refresh()
+
+    def refresh(self):
+        self.beginResetModel()
+        self.rows = self.visible_rows()
+        self.endResetModel()
+
+    def set_filter(self, text: str):
+        self.filter_text = text
+        self.refresh()
+
+    def set_sort(self, name: str):
+        self.sort_name = name
+        self.refresh()
+
+    def exclude(self, view_rows: Iterable[int]) -> int:
+        # Remoção em lote: marca no mapa e reconstrói as linhas visíveis uma única vez
+        count = 0
+        for row in view_rows:
+            position = self.rows[row]
+            if not self.excluded[position]:
+                self.excluded[position] = 1
+                count += 1
+        if count:
+            self.beginResetModel()
+            self.rows = array("L", (position for position in self.rows if not self.excluded[position]))
+            self.endResetModel()
+        return count
+
+    def included_entries(self) -> CompactPlan:
+        # Sempre na ordem do plano, qualquer que seja a ordenação ou o filtro da tela
+        return self.entries.select(i for i in range(len(self.entries)) if not self.excluded[i])
+
+    def action_count(self) -> int:
+        return sum(1 for i in range(len(self.entries)) if not self.excluded[i] and self.entries.has_dest(i))
@@ -0,0 +1,201 @@
+import os
+import sys
+import errno
+import shutil
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Sequence
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem ioctl, a cópia fica com o shutil
+    fcntl = None
+
+# Execução paralela das transferências. Arquivos pequenos são dominados pela latência
+# (abrir, criar, fechar), então várias cópias ao mesmo tempo rendem quase linearmente;
+# o limite por disco (st_dev) evita que um HD seja disputado por todas as threads.
+DEFAULT_TRANSFER_WORKERS = 4
+DEFAULT_TRANSFERS_PER_DEVICE = 2
+QUEUE_PER_WORKER = 4  # Cadeias enviadas ao pool por thread; o resto espera na lista
+UNKNOWN_DEVICE = -1
+
+# Cópia no kernel (Linux): reflink, copy_file_range, sendfile e, por fim, leitura/escrita com buffer
+FICLONE = 0x40049409  # _IOW(0x94, 9, int), de linux/fs.h
+KERNEL_CHUNK = 64 * 1024 * 1024  # Bytes por chamada de copy_file_range/sendfile
+COPY_BUFFER = 1024 * 1024
+# Erros que só dizem "este caminho não serve aqui" (outro sistema de arquivos, kernel antigo,
+# tipo de arquivo sem suporte); qualquer outro erro é real e sobe
+UNSUPPORTED_ERRORS = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSUP,
+                      errno.EBADF, errno.ETXTBSY, errno.EPERM}
+COPY_REFLINK = "reflink"
+COPY_FILE_RANGE = "copy_file_range"
+COPY_SENDFILE = "sendfile"
+COPY_BUFFERED = "buffer"
+COPY_SHUTIL = "shutil"
+PARTIAL_SUFFIX = ".parcial"  # Cópia em andamento: ".nome.ext.parcial" na pasta de destino
+
+
+def partial_path(dest: Path) -> Path:
+    return dest.with_name(f".{dest.name}{PARTIAL_SUFFIX}")
+
+
+def copy_file(src: Path, dest: Path) -> str:
+    # Mesmo efeito de shutil.copy2 (conteúdo + datas e permissões); devolve o método usado.
+    # A cópia é feita num nome temporário e só então renomeada para dest: uma queda no meio
+    # nunca deixa um arquivo cortado com o nome final.
+    partial = partial_path(dest)
+    try:
+        if sys.platform.startswith("linux"):
+            with open(src, "rb") as fsrc, open(partial, "wb") as fdst:
+                method = copy_contents(fsrc.fileno(), fdst.fileno())
+            shutil.copystat(src, partial)
+        else:
+            shutil.copy2(src, partial)
+            method = COPY_SHUTIL
+        os.replace(partial, dest)
+    except BaseException:
+        try:
+            os.unlink(partial)
+        except OSError:
+            pass
+        raise
+    return method
+
+
+def copy_contents(src_fd: int, dest_fd: int) -> str:
+    if fcntl is not None:
+        try:
+            fcntl.ioctl(dest_fd, FICLONE, src_fd)  # btrfs/XFS: compartilha os blocos, cópia instantânea
+            return COPY_REFLINK
+        except OSError as e:
+            if e.errno not in UNSUPPORTED_ERRORS and e.errno != errno.ENOTTY:
+                raise
+    for method, copy_chunk in ((COPY_FILE_RANGE, getattr(os, "copy_file_range", None)),
+                               (COPY_SENDFILE, lambda s, d, n: os.sendfile(d, s, None, n))):
+        if copy_chunk is not None and kernel_copy(copy_chunk, src_fd, dest_fd):
+            return method
+    buffer = bytearray(COPY_BUFFER)
+    with memoryview(buffer) as view:
+        while True:
+            n = os.readv(src_fd, [buffer])
+            if not n:
+                break
+            written = 0
+            while written < n:
+                written += os.write(dest_fd, view[written:n])
+    return COPY_BUFFERED
+
+
+def kernel_copy(copy_chunk: Callable[[int, int, int], int], src_fd: int, dest_fd: int) -> bool:
+    # Copia até o fim do arquivo sem passar os dados pelo Python. False se o método não é
+    # suportado; nesse caso os dois arquivos voltam ao início para o próximo método.
+    copied = 0
+    try:
+        while True:
+            n = copy_chunk(src_fd, dest_fd, KERNEL_CHUNK)
+            if not n:
+                break
+            copied += n
+    except OSError as e:
+        if e.errno not in UNSUPPORTED_ERRORS:
+            raise
+        rewind(src_fd, dest_fd)
+        return False
+    if copied == 0 and os.fstat(src_fd).st_size > 0:
+        # Alguns kernels devolvem 0 em vez de erro entre sistemas de arquivos diferentes
+        rewind(src_fd, dest_fd)
+        return False
+    return True
+
+
+def rewind(src_fd: int, dest_fd: int):
+    os.lseek(src_fd, 0, os.SEEK_SET)
+    os.lseek(dest_fd, 0, os.SEEK_SET)
+    os.ftruncate(dest_fd, 0)
+
+
+class DeviceLimiter:
+    # Um semáforo por dispositivo; a transferência segura o da origem e o do destino
+    def __init__(self, per_device: int = DEFAULT_TRANSFERS_PER_DEVICE):
+        self.per_device = max(1, per_device)
+        self.lock = threading.Lock()
+        self.semaphores: Dict[int, threading.BoundedSemaphore] = {}
+        self.devices: Dict[str, int] = {}
+
+    def device_of(self, path: Path) -> int:
+        # st_dev da pasta do arquivo (cache por pasta). Pastas de destino ainda não criadas
+        # herdam o dispositivo da primeira pasta acima delas que existe.
+        key = str(path.parent)
+        with self.lock:
+            device = self.devices.get(key)
+        if device is not None:
+            return device
+        probe = path.parent
+        while True:
+            try:
+                device = os.stat(probe).st_dev
+                break
+            except OSError:
+                if probe.parent == probe:
+                    device = UNKNOWN_DEVICE
+                    break
+                probe = probe.parent
+        with self.lock:
+            self.devices[key] = device
+        return device
+
+    def semaphore(self, device: int) -> threading.BoundedSemaphore:
+        with self.lock:
+            semaphore = self.semaphores.get(device)
+            if semaphore is None:
+                semaphore = self.semaphores[device] = threading.BoundedSemaphore(self.per_device)
+            return semaphore
+
+    @contextmanager
+    def hold(self, paths: Sequence[Path]):
+        # Semáforos sempre adquiridos em ordem crescente de st_dev: duas threads copiando em
+        # sentidos opostos entre os mesmos discos não travam uma à espera da outra
+        devices = sorted({self.device_of(path) for path in paths})
+        semaphores = [self.semaphore(device) for device in devices]
+        for semaphore in semaphores:
+            semaphore.acquire()
+        try:
+            yield
+        finally:
+            for semaphore in reversed(semaphores):
+                semaphore.release()
+
+
+def run_chains(chains: Iterable[List], step: Callable, workers: int, cancelled: threading.Event):
+    # Cada cadeia é executada em ordem por uma única thread; cadeias diferentes rodam em
+    # paralelo. Entradas que dependem umas das outras (mesmo arquivo de destino) ficam na
+    # mesma cadeia. O primeiro erro interrompe as demais cadeias e é relançado.
+    failed = threading.Event()
+
+    def run_chain(chain: List):
+        for item in chain:
+            if cancelled.is_set() or failed.is_set():
+                return
+            try:
+                step(item)
+            except BaseException:
+                failed.set()
+                raise
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        pending = set()
+        try:
+            for chain in chains:
+                if cancelled.is_set() or failed.is_set():
+                    break
+                if len(pending) >= QUEUE_PER_WORKER * workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        future.result()
+                pending.add(executor.submit(run_chain, chain))
+        finally:
+            done, _ = wait(pending)
+        for future in done:
+            future.result()
@@ -0,0 +1,157 @@
+import os
+import struct
+import threading
+from array import array
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+# Registro de desfazer de uma execução, em disco e compacto. Cada pasta é gravada uma vez e
+# ganha um número; cada transferência guarda só os números das pastas e os nomes dos arquivos.
+# Em memória fica apenas o offset de cada registro (8 bytes por transferência).
+UNDO_SUFFIX = ".undo"
+UNDO_MAGIC = b"ORGUNDO1"
+FLUSH_EVERY = 1000
+
+RECORD_FOLDER = 0
+RECORD_MOVE = 1
+RECORD_COPY = 2
+ACTIONS = {"move": RECORD_MOVE, "copy": RECORD_COPY}
+ACTION_NAMES = {code: name for name, code in ACTIONS.items()}
+
+FOLDER_HEADER = struct.Struct("<BII")  # tipo, número da pasta, tamanho do caminho
+ACTION_HEADER = struct.Struct("<BIHIH")  # tipo, pasta e tamanho do nome de origem, idem de destino
+
+
+class UndoLog:
+    # Usado como a pilha de desfazer: append, pop e len. Seguro entre threads.
+    def __init__(self, path: Path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.folders: List[str] = []
+        self.folder_ids: Dict[str, int] = {}
+        self.folder_offsets = array("Q")
+        self.offsets = array("Q")
+        self.unflushed = 0
+        exists = path.exists()
+        self.file = path.open("r+b" if exists else "w+b")
+        if exists:
+            self.load()
+        else:
+            self.file.write(UNDO_MAGIC)
+
+    @classmethod
+    def create(cls, folder: Path) -> "UndoLog":
+        folder.mkdir(parents=True, exist_ok=True)
+        return cls(folder / f"execucao-{datetime.now():%Y%m%d-%H%M%S-%f}{UNDO_SUFFIX}")
+
+    @classmethod
+    def rewrite(cls, path: Path) -> "UndoLog":
+        # Recomeça o registro de uma execução retomada; o diário devolve as ações já feitas
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.unlink(missing_ok=True)
+        return cls(path)
+
+    def load(self):
+        if self.file.read(len(UNDO_MAGIC)) != UNDO_MAGIC:
+            raise ValueError(f"Registro de desfazer inválido: {self.path}")
+        end = self.file.seek(0, os.SEEK_END)
+        self.file.seek(len(UNDO_MAGIC))
+        offset = len(UNDO_MAGIC)
+        while offset < end:
+            kind = self.file.read(1)
+            self.file.seek(offset)
+            try:
+                if kind[0] == RECORD_FOLDER:
+                    _, folder_id, size = FOLDER_HEADER.unpack(self.file.read(FOLDER_HEADER.size))
+                    self.remember_folder(os.fsdecode(self.read_exact(size)), offset)
+                else:
+                    _, _, src_size, _, dest_size = ACTION_HEADER.unpack(self.file.read(ACTION_HEADER.size))
+                    self.read_exact(src_size + dest_size)
+                    self.offsets.append(offset)
+            except (struct.error, EOFError):  # Registro cortado no fim (queda): descartado
+                break
+            offset = self.file.tell()
+        self.file.truncate(offset)
+        self.file.seek(offset)
+
+    def read_exact(self, size: int) -> bytes:
+        data = self.file.read(size)
+        if len(data) != size:
+            raise EOFError
+        return data
+
+    def remember_folder(self, folder: str, offset: int) -> int:
+        folder_id = self.folder_ids[folder] = len(self.folders)
+        self.folders.append(folder)
+        self.folder_offsets.append(offset)
+        return folder_id
+
+    def folder_id(self, folder: str) -> int:
+        folder_id = self.folder_ids.get(folder)
+        if folder_id is None:
+            folder_id = self.remember_folder(folder, self.file.tell())
+            encoded = os.fsencode(folder)
+            self.file.write(FOLDER_HEADER.pack(RECORD_FOLDER, folder_id, len(encoded)) + encoded)
+        return folder_id
+
+    def append(self, action: Dict):
+        source_folder, source_name = os.path.split(action["source"])
+        dest_folder, dest_name = os.path.split(action["dest"])
+        source_name, dest_name = os.fsencode(source_name), os.fsencode(dest_name)
+        with self.lock:
+            source_id, dest_id = self.folder_id(source_folder), self.folder_id(dest_folder)
+            self.offsets.append(self.file.tell())
+            self.file.write(ACTION_HEADER.pack(ACTIONS[action["action"]], source_id, len(source_name),
+                                               dest_id, len(dest_name)) + source_name + dest_name)
+            self.unflushed += 1
+            if self.unflushed >= FLUSH_EVERY:
+                self.file.flush()
+                self.unflushed = 0
+
+    def read_at(self, offset: int) -> Dict:
+        self.file.seek(offset)
+        kind, source_id, source_size, dest_id, dest_size = ACTION_HEADER.unpack(self.file.read(ACTION_HEADER.size))
+        names = self.file.read(source_size + dest_size)
+        return {"action": ACTION_NAMES[kind],
+                "source": os.path.join(self.folders[source_id], os.fsdecode(names[:source_size])),
+                "dest": os.path.join(self.folders[dest_id], os.fsdecode(names[source_size:]))}
+
+    def pop(self) -> Dict:
+        with self.lock:
+            offset = self.offsets.pop()
+            action = self.read_at(offset)
+            self.file.truncate(offset)
+            self.file.seek(offset)
+            # Pastas gravadas depois desse registro saíram do arquivo junto com ele
+            while self.folder_offsets and self.folder_offsets[-1] >= offset:
+                self.folder_offsets.pop()
+                del self.folder_ids[self.folders.pop()]
+            return action
+
+    def reversed_actions(self) -> Iterator[Dict]:
+        # Da última transferência para a primeira, lendo um registro por vez do disco
+        for index in range(len(self) - 1, -1, -1):
+            with self.lock:
+                position = self.file.tell()
+                action = self.read_at(self.offsets[index])
+                self.file.seek(position)
+            yield action
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+    def remove(self):
+        self.close()
+        self.path.unlink(missing_ok=True)
+
+
+def latest_undo_log(folder: Path) -> Optional[Path]:
+    if not folder.is_dir():
+        return None
+    logs = sorted(folder.glob(f"*{UNDO_SUFFIX}"))
+    return logs[-1] if logs else None
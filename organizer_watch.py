@@ -0,0 +1,299 @@
+import os
+import sys
+import errno
+import time
+import queue
+import select
+import struct
+import ctypes
+import ctypes.util
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from organizer_engine import (PLAN_CHUNK, DestinationIndex, DirectoryTable, FileOrganizer, FileRecord,
+                              stat_record)
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:  # Opcional: só é usado fora do Linux
+    FileSystemEventHandler = object
+    Observer = None
+
+# Modo observação: organiza os arquivos conforme chegam às pastas de origem, sem varrer tudo
+# de novo. No Linux usa inotify (via ctypes); nos outros sistemas, watchdog, se instalado. Um
+# arquivo só é organizado depois de WATCH_SETTLE_SECONDS sem eventos e com tamanho e mtime
+# estáveis (ainda sendo gravado => espera mais). O custo por lote depende dos arquivos novos,
+# não do tamanho das pastas.
+WATCH_SETTLE_SECONDS = 2.0
+WATCH_POLL_SECONDS = 1.0
+
+WATCH_FILE = "arquivo"  # Arquivo gravado, fechado ou chegou por rename
+WATCH_GONE = "removido"  # Saiu antes de ser organizado
+WATCH_FOLDER = "pasta"  # Pasta nova: o conteúdo dela é lido e observado
+WATCH_RESCAN = "releitura"  # Eventos perdidos (fila do kernel cheia): relê as origens
+
+# linux/inotify.h
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000  # Valores do Linux fixos: os.O_NONBLOCK não existe no Windows
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_ONLYDIR
+EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len (struct inotify_event)
+READ_SIZE = 64 * 1024
+
+
+class InotifyWatcher:
+    # Um watch por pasta (inotify não é recursivo); pastas novas ganham watch ao aparecer
+    def __init__(self, log: Optional[Callable[[str], None]] = None):
+        self.log = log or (lambda message: None)
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.add_watch = libc.inotify_add_watch
+        self.add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.rm_watch = libc.inotify_rm_watch
+        self.rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify indisponível")
+        self.folders: Dict[int, Path] = {}  # wd -> pasta
+
+    def add_tree(self, folder: Path) -> Iterator[Path]:
+        # Observa a pasta e as subpastas; devolve os arquivos que já estão nelas. O watch vem
+        # antes da leitura: o que chegar no meio aparece nos dois e é contado uma vez só.
+        # Se o watch falhar, os arquivos que já estão lá ainda são organizados, mas os que
+        # chegarem depois não: o erro vai para o log.
+        wd = self.add_watch(self.fd, os.fsencode(folder), WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            hint = " (aumente fs.inotify.max_user_watches)" if err == errno.ENOSPC else ""
+            self.log(f"Pasta não observada: {folder}: {os.strerror(err)} [errno {err}]{hint}")
+        else:
+            self.folders[wd] = folder
+        try:
+            with os.scandir(folder) as it:
+                entries = list(it)
+        except OSError:
+            return
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    yield from self.add_tree(Path(entry.path))
+                elif entry.is_file(follow_symlinks=False):
+                    yield Path(entry.path)
+            except OSError:
+                continue
+
+    add_root = add_tree  # Cada pasta tem o próprio watch; a raiz não é diferente
+
+    def forget_tree(self, folder: Path):
+        # Pasta movida para fora: os watches dela e das subpastas deixam de valer
+        prefix = str(folder) + os.sep
+        for wd, path in list(self.folders.items()):
+            if path == folder or str(path).startswith(prefix):
+                self.rm_watch(self.fd, wd)
+                del self.folders[wd]
+
+    def read(self, timeout: float) -> List[Tuple[str, Path]]:
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self.fd, READ_SIZE)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, size = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + size].rstrip(b"\0")
+            offset += size
+            if mask & IN_Q_OVERFLOW:
+                events.append((WATCH_RESCAN, Path()))
+                continue
+            if mask & IN_IGNORED:
+                self.folders.pop(wd, None)
+                continue
+            folder = self.folders.get(wd)
+            if folder is None or not name:
+                continue
+            path = folder / os.fsdecode(name)
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    events.append((WATCH_FOLDER, path))
+                elif mask & IN_MOVED_FROM:
+                    self.forget_tree(path)
+            elif mask & (IN_DELETE | IN_MOVED_FROM):
+                events.append((WATCH_GONE, path))
+            elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO | IN_MODIFY):
+                events.append((WATCH_FILE, path))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class WatchdogWatcher(FileSystemEventHandler):
+    # Mesma interface com o watchdog (Windows, macOS). Sem evento de "fechado" em todos os
+    # sistemas: criação e modificação contam como escrita e a espera decide quando terminou.
+    def __init__(self):
+        super().__init__()
+        self.events: "queue.Queue[Tuple[str, Path]]" = queue.Queue()
+        self.observer = Observer()
+        self.observer.start()
+        self.roots = set()
+
+    def add_root(self, folder: Path) -> Iterator[Path]:
+        # Um observador recursivo por origem, agendado uma vez só (a releitura só lista de novo)
+        key = os.path.normcase(str(folder))
+        if key not in self.roots:
+            self.observer.schedule(self, str(folder), recursive=True)
+            self.roots.add(key)
+        return self.add_tree(folder)
+
+    def add_tree(self, folder: Path) -> Iterator[Path]:
+        # Pasta nova dentro de uma origem: já coberta pelo observador recursivo, só é listada
+        for current, _, names in os.walk(folder):
+            for name in names:
+                yield Path(current) / name
+
+    def on_created(self, event):
+        self.events.put((WATCH_FOLDER if event.is_directory else WATCH_FILE, Path(event.src_path)))
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self.events.put((WATCH_FILE, Path(event.src_path)))
+
+    def on_closed(self, event):
+        self.events.put((WATCH_FILE, Path(event.src_path)))
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            self.events.put((WATCH_GONE, Path(event.src_path)))
+        self.events.put((WATCH_FOLDER if event.is_directory else WATCH_FILE, Path(event.dest_path)))
+
+    def on_deleted(self, event):
+        if not event.is_directory:
+            self.events.put((WATCH_GONE, Path(event.src_path)))
+
+    def read(self, timeout: float) -> List[Tuple[str, Path]]:
+        try:
+            events = [self.events.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        while True:
+            try:
+                events.append(self.events.get_nowait())
+            except queue.Empty:
+                return events
+
+    def close(self):
+        self.observer.stop()
+        self.observer.join()
+
+
+def create_watcher(log: Optional[Callable[[str], None]] = None):
+    if sys.platform.startswith("linux"):
+        return InotifyWatcher(log)
+    if Observer is None:
+        raise OSError("Modo observação requer inotify (Linux) ou o pacote watchdog")
+    return WatchdogWatcher()
+
+
+class FolderWatch:
+    def __init__(self, organizer: FileOrganizer, settle: float = WATCH_SETTLE_SECONDS):
+        self.organizer = organizer
+        self.settle = settle
+        self.log = organizer.log
+        self.pending: Dict[Path, Tuple[float, Optional[Tuple[int, int]]]] = {}  # prazo, (tamanho, mtime)
+        self.dest_prefix = os.path.normcase(str(organizer.options.pasta_destino)) + os.sep
+        self.organized = 0
+
+    def run(self):
+        # Até organizer.cancel(); os arquivos que já estão nas origens entram no primeiro lote
+        organizer = self.organizer
+        if organizer.options.deduplicar_conteudo:
+            self.log("Modo observação: deduplicação por conteúdo ignorada (precisa da árvore inteira)")
+        organizer.dest_index = DestinationIndex(verify_on_disk=True)
+        watcher = create_watcher(self.log)
+        try:
+            self.add_roots(watcher)
+            self.log(f"Observando {len(organizer.options.pastas_origem)} pasta(s) de origem...")
+            while not organizer.cancelled.is_set():
+                for kind, path in watcher.read(self.next_timeout()):
+                    self.handle(watcher, kind, path)
+                ready = self.take_ready()
+                if ready:
+                    self.organize(ready)
+        finally:
+            watcher.close()
+            self.log(f"Observação encerrada: {self.organized} arquivos organizados.")
+
+    def add_roots(self, watcher):
+        for origem in self.organizer.options.pastas_origem:
+            if not origem.is_dir():
+                self.log(f"Pasta de origem não encontrada: {origem}")
+        for origem in self.organizer.source_roots():
+            for path in watcher.add_root(origem):
+                self.touch(path)
+
+    def handle(self, watcher, kind: str, path: Path):
+        if kind == WATCH_FILE:
+            self.touch(path)
+        elif kind == WATCH_GONE:
+            self.pending.pop(path, None)
+        elif kind == WATCH_FOLDER:
+            for file_path in watcher.add_tree(path):
+                self.touch(file_path)
+        elif kind == WATCH_RESCAN:
+            self.log("Fila de eventos cheia: relendo as pastas de origem")
+            self.add_roots(watcher)
+
+    def touch(self, path: Path):
+        # Cada evento adia o prazo do arquivo: só sai quando ficar quieto
+        if os.path.normcase(str(path)).startswith(self.dest_prefix) or not self.organizer.matches(path.name):
+            return
+        previous = self.pending.get(path)
+        self.pending[path] = (time.monotonic() + self.settle, previous[1] if previous else None)
+
+    def next_timeout(self) -> float:
+        if not self.pending:
+            return WATCH_POLL_SECONDS
+        deadline = min(deadline for deadline, _ in self.pending.values())
+        return min(WATCH_POLL_SECONDS, max(0.0, deadline - time.monotonic()))
+
+    def take_ready(self) -> List[FileRecord]:
+        now = time.monotonic()
+        ready = []
+        for path, (deadline, fingerprint) in list(self.pending.items()):
+            if deadline > now:
+                continue
+            record = stat_record(path)
+            if record is None:  # Sumiu sem evento (ex.: arquivo temporário)
+                del self.pending[path]
+            elif record.fingerprint != fingerprint:
+                # Mudou desde a última olhada: ainda sendo gravado (ou primeira olhada)
+                self.pending[path] = (now + self.settle, record.fingerprint)
+            else:
+                del self.pending[path]
+                ready.append(record)
+                if len(ready) >= PLAN_CHUNK:
+                    break
+        return ready
+
+    def organize(self, records: List[FileRecord]):
+        # Lote decidido e executado com o mesmo índice de destino, sem reler as pastas
+        organizer = self.organizer
+        with organizer.index_lock:
+            entries = organizer.decide_many(records, DirectoryTable())
+        organizer.execute(entries, keep_index=True)
+        organizer.dest_index.forget_planned()
+        self.organized += len(records)
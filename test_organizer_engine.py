@@ -0,0 +1,196 @@
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from organizer_engine import FileOrganizer, Options, load_journal
+from organizer_journal import pending_journals
+from organizer_transfer import partial_path
+from organizer_undo import UndoLog
+
+OLD_MTIME = 1577836800  # 2020-01-01
+
+
+class ContentDuplicateKeeperTest(unittest.TestCase):
+    # Duplicatas de conteúdo só podem ser excluídas se o conteúdo continuar em algum lugar
+    def setUp(self):
+        self.base = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.base)
+        for folder in "ABD":
+            (self.base / folder).mkdir()
+
+    def write(self, relative: str, content: bytes, mtime: int = None) -> Path:
+        path = self.base / relative
+        path.write_bytes(content)
+        if mtime is not None:
+            os.utime(path, (mtime, mtime))
+        return path
+
+    def run_organizer(self):
+        options = Options.from_template({})
+        options.pastas_origem = [self.base / "A", self.base / "B"]
+        options.pasta_destino = self.base / "D"
+        options.filtro = "*"
+        options.mover_arquivos = True
+        options.deduplicar_conteudo = True
+        options.usar_lixeira = False
+        options.diario_execucao = False
+        organizer = FileOrganizer(options, confirm_delete=lambda path: True)
+        organizer.execute(organizer.plan())
+
+    def contents(self):
+        return [path.read_bytes() for path in self.base.rglob("*") if path.is_file()]
+
+    def test_name_collision_with_other_content_keeps_a_copy(self):
+        # A/x.jpg colide por nome com D/x.jpg (outro conteúdo, mais novo): sem hash a regra do
+        # nome manda excluí-lo, então B/y.jpg não pode ser excluído como "igual a D/x.jpg"
+        self.write("A/x.jpg", b"mesmo conteudo", OLD_MTIME)
+        self.write("B/y.jpg", b"mesmo conteudo", OLD_MTIME)
+        self.write("D/x.jpg", b"outro conteudo, maior")
+        self.run_organizer()
+        self.assertIn(b"mesmo conteudo", self.contents())
+        self.assertEqual((self.base / "D" / "x.jpg").read_bytes(), b"outro conteudo, maior")
+
+    def test_name_collision_with_same_content_deletes_duplicates(self):
+        self.write("A/x.jpg", b"mesmo conteudo", OLD_MTIME)
+        self.write("B/y.jpg", b"mesmo conteudo", OLD_MTIME)
+        self.write("D/x.jpg", b"mesmo conteudo")
+        self.run_organizer()
+        self.assertEqual(self.contents(), [b"mesmo conteudo"])
+
+
+class UndoLogTest(unittest.TestCase):
+    # Registro binário: o que volta do disco tem que ser exatamente o que foi gravado
+    def setUp(self):
+        self.base = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.base)
+        self.path = self.base / "teste.undo"
+
+    def action(self, kind: str, source: str, dest: str):
+        return {"action": kind, "source": str(self.base / source), "dest": str(self.base / dest)}
+
+    def reopen(self, log: UndoLog) -> UndoLog:
+        log.close()
+        log = UndoLog(self.path)
+        self.addCleanup(log.close)
+        return log
+
+    def test_append_pop_reopen_round_trip(self):
+        first = self.action("move", "A/x.jpg", "D/x.jpg")
+        second = self.action("copy", "B/ação.png", "D/png/ação_1.png")
+        last = self.action("move", "C/z.txt", "E/z.txt")
+        log = UndoLog(self.path)
+        for action in (first, second, last):
+            log.append(action)
+        self.assertEqual(log.pop(), last)
+        self.assertEqual(log.pop(), second)  # Leva junto as pastas C e E, gravadas depois dele
+        third = self.action("move", "F/w.txt", "D/w.txt")
+        log.append(third)
+        log = self.reopen(log)
+        self.assertEqual(list(log.reversed_actions()), [third, first])
+        log.append(second)
+        log = self.reopen(log)
+        self.assertEqual(len(log), 3)
+        self.assertEqual(list(log.reversed_actions()), [second, third, first])
+        self.assertEqual(log.pop(), second)
+
+    def test_torn_last_record_is_dropped_on_reload(self):
+        first = self.action("move", "A/x.jpg", "D/x.jpg")
+        log = UndoLog(self.path)
+        log.append(first)
+        log.close()
+        intact_size = self.path.stat().st_size
+        log = UndoLog(self.path)
+        log.append(self.action("move", "A/um_nome_bem_mais_comprido.jpg", "D/um_nome_bem_mais_comprido.jpg"))
+        log.close()
+        with self.path.open("r+b") as f:  # Queda no meio da gravação do último registro
+            f.truncate(self.path.stat().st_size - 3)
+        log = UndoLog(self.path)
+        self.addCleanup(log.close)
+        self.assertEqual(list(log.reversed_actions()), [first])
+        self.assertEqual(self.path.stat().st_size, intact_size)
+        second = self.action("copy", "A/z.jpg", "D/z.jpg")
+        log.append(second)  # O resto cortado foi descartado: o registro novo fica legível
+        log = self.reopen(log)
+        self.assertEqual(list(log.reversed_actions()), [second, first])
+
+
+class ResumeTest(unittest.TestCase):
+    # Execução cancelada e retomada como no --retomar: cada arquivo chega ao destino uma vez e o
+    # registro de desfazer termina com todas as transferências
+    COUNT = 20
+
+    def setUp(self):
+        self.base = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.base)
+        self.source = self.base / "origem"
+        self.dest = self.base / "destino"
+        self.source.mkdir()
+        for i in range(self.COUNT):
+            (self.source / f"arquivo{i:02d}.txt").write_bytes(f"conteudo {i}".encode() * (i + 1))
+        self.journals = self.base / "diarios"
+        patcher = mock.patch("organizer_engine.JOURNAL_DIR", self.journals)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def cancelled_run(self, after: int) -> Path:
+        options = Options.from_template({})
+        options.pastas_origem = [self.source]
+        options.pasta_destino = self.dest
+        options.filtro = "*"
+        options.threads_transferencia = 1
+        undo_log = UndoLog.create(self.base / "desfazer")
+        copied = []
+
+        def log(message: str):
+            if message.startswith("Copiado"):
+                copied.append(message)
+                if len(copied) == after:
+                    organizer.cancel()
+
+        organizer = FileOrganizer(options, log=log, undo_stack=undo_log)
+        organizer.execute(organizer.plan())
+        undo_log.close()
+        journals = pending_journals(self.journals)
+        self.assertEqual(len(journals), 1)
+        return journals[0]
+
+    def resume(self, journal: Path) -> UndoLog:
+        options, entries, state = load_journal(journal)
+        undo_log = UndoLog.rewrite(Path(state.undo))
+        self.addCleanup(undo_log.close)
+        FileOrganizer(options, undo_stack=undo_log).execute(entries, state)
+        return undo_log
+
+    def assert_complete(self, undo_log: UndoLog):
+        names = sorted(path.name for path in self.source.iterdir())
+        self.assertEqual(sorted(path.name for path in self.dest.iterdir()), names)
+        for name in names:
+            self.assertEqual((self.dest / name).read_bytes(), (self.source / name).read_bytes())
+        actions = list(undo_log.reversed_actions())
+        self.assertEqual(len(actions), len(names))
+        self.assertEqual(sorted(Path(action["dest"]).name for action in actions), names)
+        self.assertEqual(pending_journals(self.journals), [])
+
+    def test_cancelled_run_resumes_each_file_once(self):
+        journal = self.cancelled_run(after=5)
+        self.assert_complete(self.resume(journal))
+
+    def test_resume_after_lost_done_records_and_partial_copy(self):
+        journal = self.cancelled_run(after=5)
+        # Queda: os últimos "done" não chegaram ao disco e uma cópia ficou pela metade; a origem
+        # dessa cópia foi apagada antes da retomada, então ninguém grava por cima do .parcial
+        lines = journal.read_text(encoding="utf-8").splitlines(keepends=True)
+        done = [i for i, line in enumerate(lines) if line.startswith('{"t":"d"')]
+        journal.write_text("".join(line for i, line in enumerate(lines) if i not in done[-2:]), encoding="utf-8")
+        _, entries, _ = load_journal(journal)
+        missing = next(entry for entry in entries if not entry.dest.exists())
+        partial_path(missing.dest).write_bytes(b"pela metade")
+        missing.source.unlink()
+        self.assert_complete(self.resume(journal))
+
+
+if __name__ == "__main__":
+    unittest.main()